@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2 as cv
+import numpy as np
+import pandas as pd
+
+import calib
+from multiview import fundamental_matrix
+from triangulate import triangulate_session
+from synthetic_data import (default_rig, load_rig, random_board_poses, render_checkerboard_videos,
+                            dog_trajectory, write_landmark_stream)
+
+# End-to-end benchmark on synthetic data with known ground truth: times checkerboard
+# detection, calibrate_from_videos, join_jsons.py and triangulation, checks their accuracy
+# and compares throughput against a saved baseline.
+
+# Landmarks that join_jsons.py maps to the same joint in both views, with their joint names.
+BENCHMARK_LANDMARKS = {
+    "left_eye": "animal_joint_left_eye",
+    "right_eye": "animal_joint_right_eye",
+    "nose": "animal_joint_nose",
+    "left_ear_top": "animal_joint_left_ear_top",
+    "left_ear_middle": "animal_joint_left_ear_middle",
+    "left_ear_bottom": "animal_joint_left_ear_bottom",
+    "right_ear_top": "animal_joint_right_ear_top",
+    "right_ear_middle": "animal_joint_right_ear_middle",
+    "right_ear_bottom": "animal_joint_right_ear_bottom",
+    "neck": "animal_joint_heck",
+    "tail_top": "animal_joint_tail_top",
+    "tail_middle": "animal_joint_tail_middle",
+    "tail_bottom": "animal_joint_tail_bottom",
+    "left_back_elbow": "animal_joint_left_back_elbow",
+    "left_back_knee": "animal_joint_left_back_knee",
+    "right_back_elbow": "animal_joint_right_back_elbow",
+    "right_back_paw": "animal_joint_right_back_paw",
+}
+
+# Accuracy limits; exceeding any of them fails the benchmark.
+MAX_FOCAL_ERROR = 0.01          # relative focal length error
+MAX_ROTATION_ERROR = 0.5        # degrees
+MAX_TRANSLATION_ERROR = 0.02    # relative to the baseline length
+# RMS 3D error in checkerboard units. With the default rig a pixel of landmark noise already
+# gives ~4 units of depth error (8 unit baseline, dog ~100 units away).
+MAX_TRIANGULATION_ERROR = 10.0
+MAX_REPROJECTION_ERROR = 2.0    # median RMS, pixels
+# Correct pairs are within a few pixels of their epipolar lines, so a gate of this many pixels
+# should reject almost nothing.
+MAX_EPIPOLAR_DISTANCE = 10.0
+MAX_GATE_REJECTED = 0.05
+# Fraction of side-view landmarks moved off their epipolar lines by OUTLIER_SHIFT pixels, and
+# the fraction of those the gate has to reject. The shift is vertical, across the epipolar lines
+# of cameras placed side by side.
+OUTLIER_FRACTION = 0.1
+OUTLIER_SHIFT = 30.0
+MIN_OUTLIERS_REJECTED = 0.9
+# Calibration videos sampled fewer times than this (600 frames at interval 5) do not reliably
+# meet the limits above, whether they do depends on which board poses happen to be drawn.
+MIN_CALIBRATION_SAMPLES = 120
+
+# Run func `repeat` times and return its result and the best wall time, which is far less
+# noisy than a single run.
+def _timed(func, *args, repeat=1, **kwargs):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+def _rotation_error(R_est, R_true):
+    angle = np.linalg.norm(cv.Rodrigues(R_est @ np.asarray(R_true).T)[0])
+    return np.degrees(angle)
+
+def benchmark_calibration(workdir, rig, settings, n_frames, interval):
+    cmtxs, dists, Rs, Ts = rig
+    img_shape = (settings['frame_width'], settings['frame_height'])
+    board_rvecs, board_tvecs = random_board_poses(n_frames)
+    paths = render_checkerboard_videos(workdir, cmtxs, dists, Rs, Ts, board_rvecs, board_tvecs,
+                                       settings['checkerboard_rows'], settings['checkerboard_columns'],
+                                       settings['checkerboard_box_size_scale'], img_shape)
+
+    (_, corners_per_camera, _), detection_time = _timed(calib.detect_board_observations, paths, interval)
+    n_sampled = len(paths) * len(range(0, n_frames, interval))
+    (cmtx0, _, cmtx1, _, R, T, _), calibration_time = _timed(calib.calibrate_from_videos, paths[0], paths[1],
+                                                             interval)
+
+    focal_error = max(abs(est[i, i] / true[i, i] - 1) for est, true in ((cmtx0, cmtxs[0]), (cmtx1, cmtxs[1]))
+                      for i in range(2))
+    translation_error = np.linalg.norm(np.ravel(T) - np.ravel(Ts[1])) / np.linalg.norm(Ts[1])
+    return {
+        "detection_frames_per_second": n_sampled / detection_time,
+        "detected_views": [len(corners) for corners in corners_per_camera],
+        "calibration_seconds": calibration_time,
+        "calibration_frames_per_second": n_sampled / calibration_time,
+        "focal_error": focal_error,
+        "rotation_error_degrees": _rotation_error(R, Rs[1]),
+        "translation_error": translation_error,
+    }
+
+def benchmark_landmarks(workdir, rig, settings, n_frames, noise, dropout, repeat=5):
+    cmtxs, dists, Rs, Ts = rig
+    width, height = settings['frame_width'], settings['frame_height']
+    trajectory = dog_trajectory(n_frames)
+    for cam, view in enumerate(["front", "side"]):
+        write_landmark_stream(os.path.join(workdir, f"{view}_video.json"), trajectory, cmtxs[cam], dists[cam],
+                              Rs[cam], Ts[cam], (width, height), noise=noise, dropout=dropout, seed=cam)
+
+    # join_jsons.py reads and writes fixed file names in the working directory.
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "join_jsons.py")
+    _, join_time = _timed(subprocess.run, [sys.executable, script], repeat=repeat, cwd=workdir,
+                          check=True)
+    df = pd.read_csv(os.path.join(workdir, "video_landmarks.csv"))
+
+    # Time the session triangulation triangulate.py runs, including the conversion of the
+    # Vision coordinates to undistorted pixels and the epipolar gate.
+    landmarks = list(BENCHMARK_LANDMARKS)
+    views = ["front", "side"]
+    Ps = np.stack([calib.get_projection_matrix(cmtxs[cam], Rs[cam], Ts[cam]) for cam in range(2)])
+    F = fundamental_matrix(cmtxs[0], cmtxs[1], Rs[1], Ts[1])
+    (X, _), triangulation_time = _timed(triangulate_session, df, landmarks, views, Ps, cmtxs, dists,
+                                        (width, height), repeat=repeat)
+    (X_refined, rms), refine_time = _timed(triangulate_session, df, landmarks, views, Ps, cmtxs, dists,
+                                           (width, height), refine=True, repeat=repeat)
+    X_gated, _ = triangulate_session(df, landmarks, views, Ps, cmtxs, dists, (width, height), F=F,
+                                     max_epipolar_distance=MAX_EPIPOLAR_DISTANCE)
+
+    # Shift a known subset of side-view landmarks off their epipolar lines; the gate must catch them.
+    outliers = np.random.default_rng(0).random((len(df), len(landmarks))) < OUTLIER_FRACTION
+    df_outliers = df.copy()
+    for j, lm in enumerate(landmarks):
+        df_outliers.loc[outliers[:, j], f"side_{lm}_y"] += OUTLIER_SHIFT / height
+    X_outliers, _ = triangulate_session(df_outliers, landmarks, views, Ps, cmtxs, dists, (width, height), F=F,
+                                        max_epipolar_distance=MAX_EPIPOLAR_DISTANCE)
+
+    truth = np.array([[positions[BENCHMARK_LANDMARKS[lm]] for lm in landmarks] for positions in trajectory])
+    solved = ~np.isnan(X).any(axis=-1)
+    n_points = np.sum(solved)
+
+    def rms_error(X):
+        return float(np.sqrt(np.nanmean(np.sum((X - truth) ** 2, axis=-1))))
+
+    return {
+        "join_jsons_rows_per_second": len(df) / join_time,
+        "triangulated_points": int(n_points),
+        "triangulation_points_per_second": n_points / triangulation_time,
+        "refinement_points_per_second": n_points / refine_time,
+        "triangulation_error": rms_error(X),
+        "refined_error": rms_error(X_refined),
+        "median_reprojection_error": float(np.nanmedian(rms)),
+        "gate_rejected_fraction": 1 - np.sum(~np.isnan(X_gated).any(axis=-1)) / n_points,
+        "outliers_rejected_fraction": float(np.mean(np.isnan(X_outliers[outliers & solved]).any(axis=-1))),
+    }
+
+def check_accuracy(results):
+    limits = [("focal_error", MAX_FOCAL_ERROR), ("rotation_error_degrees", MAX_ROTATION_ERROR),
+              ("translation_error", MAX_TRANSLATION_ERROR), ("triangulation_error", MAX_TRIANGULATION_ERROR),
+              ("refined_error", MAX_TRIANGULATION_ERROR), ("median_reprojection_error", MAX_REPROJECTION_ERROR),
+              ("gate_rejected_fraction", MAX_GATE_REJECTED)]
+    failures = [f"{key} = {results[key]:.4g} exceeds {limit}" for key, limit in limits
+                if key in results and not results[key] <= limit]
+    if "outliers_rejected_fraction" in results and not results["outliers_rejected_fraction"] >= MIN_OUTLIERS_REJECTED:
+        failures.append(f"outliers_rejected_fraction = {results['outliers_rejected_fraction']:.4g} "
+                        f"is below {MIN_OUTLIERS_REJECTED}")
+    return failures
+
+# Throughput metrics that dropped by more than `tolerance` relative to the baseline.
+def check_throughput(results, baseline, tolerance):
+    regressions = []
+    for key, value in results.items():
+        if key.endswith("_per_second") and key in baseline:
+            if value < (1 - tolerance) * baseline[key]:
+                regressions.append(f"{key} = {value:.1f}, baseline {baseline[key]:.1f} "
+                                   f"({100 * (value / baseline[key] - 1):.0f}%)")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark calibration and triangulation on synthetic data.")
+    parser.add_argument("--settings", default="calibration_settings.yaml", help="Calibration settings file.")
+    parser.add_argument("--camera-parameters", default=None,
+                        help="calib.py output folder to use as ground truth instead of the default synthetic rig.")
+    parser.add_argument("--calibration-frames", type=int, default=600,
+                        help=f"Length of the checkerboard videos, at least {MIN_CALIBRATION_SAMPLES} times --interval.")
+    parser.add_argument("--interval", type=int, default=5, help="Frame sample interval used for calibration.")
+    parser.add_argument("--landmark-frames", type=int, default=3000, help="Length of the landmark streams.")
+    parser.add_argument("--noise", type=float, default=1.0, help="Landmark pixel noise.")
+    parser.add_argument("--dropout", type=float, default=0.05, help="Probability that a landmark is missing.")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Runs of join_jsons.py and triangulation; the fastest one is reported.")
+    parser.add_argument("--baseline", default="benchmark_baseline.json", help="Throughput baseline file.")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed relative throughput drop before flagging a regression.")
+    args = parser.parse_args()
+    if args.calibration_frames < MIN_CALIBRATION_SAMPLES * args.interval:
+        parser.error(f"--calibration-frames must be at least {MIN_CALIBRATION_SAMPLES * args.interval} at --interval "
+                     f"{args.interval}; shorter videos do not calibrate accurately enough for the benchmark limits.")
+
+    calib.parse_calibration_settings_file(args.settings)
+    settings = calib.calibration_settings
+    rig = load_rig(args.camera_parameters) if args.camera_parameters else default_rig()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = benchmark_calibration(workdir, rig, settings, args.calibration_frames, args.interval)
+        results.update(benchmark_landmarks(workdir, rig, settings, args.landmark_frames, args.noise, args.dropout,
+                                           args.repeat))
+
+    print("--- Benchmark Results ---")
+    for key, value in results.items():
+        print(f"{key}: {value:.4g}" if isinstance(value, float) else f"{key}: {value}")
+
+    failures = check_accuracy(results)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({key: value for key, value in results.items() if key.endswith("_per_second")}, f, indent=2)
+        print("Saved baseline to", args.baseline)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            failures += check_throughput(results, json.load(f), args.tolerance)
+    else:
+        # Without a baseline regressions cannot be detected, which must not pass silently.
+        failures.append(f"No throughput baseline at {args.baseline}; run with --save-baseline to create one.")
+
+    if failures:
+        print("--- Failures ---")
+        for failure in failures:
+            print(failure)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import cv2 as cv
+import numpy as np
+
+# Per-camera intrinsic parameters: fx, fy, cx, cy, k1, k2, p1, p2, k3
+# (the same 5-coefficient distortion model OpenCV uses by default).
+N_INTRINSIC = 9
+# Per-camera extrinsic parameters (camera0 is held fixed at identity): rvec, tvec.
+N_EXTRINSIC = 6
+# Per-board-observation pose parameters in the camera0 frame: rvec, tvec.
+N_POSE = 6
+N_CAMERA = N_INTRINSIC + N_EXTRINSIC
+
+# Convert an array of rotation vectors (M, 3) into rotation matrices (M, 3, 3).
+def rodrigues(rvecs):
+    rvecs = np.asarray(rvecs, dtype=np.float64).reshape(-1, 3)
+    theta = np.linalg.norm(rvecs, axis=1)
+    small = theta < 1e-12
+    safe_theta = np.where(small, 1.0, theta)
+    k = rvecs / safe_theta[:, None]
+    K = np.zeros((len(rvecs), 3, 3))
+    K[:, 0, 1] = -k[:, 2]
+    K[:, 0, 2] = k[:, 1]
+    K[:, 1, 0] = k[:, 2]
+    K[:, 1, 2] = -k[:, 0]
+    K[:, 2, 0] = -k[:, 1]
+    K[:, 2, 1] = k[:, 0]
+    sin = np.where(small, 0.0, np.sin(theta))[:, None, None]
+    one_minus_cos = np.where(small, 0.0, 1.0 - np.cos(theta))[:, None, None]
+    return np.eye(3)[None] + sin * K + one_minus_cos * (K @ K)
+
+# Apply the pinhole + radial/tangential distortion model to camera-frame points.
+# points: (M, P, 3), intrinsics: (M, N_INTRINSIC). Returns pixel coordinates (M, P, 2).
+def project_camera_points(points, intrinsics):
+    fx, fy, cx, cy, k1, k2, p1, p2, k3 = [intrinsics[:, i, None] for i in range(N_INTRINSIC)]
+    x = points[..., 0] / points[..., 2]
+    y = points[..., 1] / points[..., 2]
+    r2 = x * x + y * y
+    radial = 1 + k1 * r2 + k2 * r2 * r2 + k3 * r2 * r2 * r2
+    xd = x * radial + 2 * p1 * x * y + p2 * (r2 + 2 * x * x)
+    yd = y * radial + p1 * (r2 + 2 * y * y) + 2 * p2 * x * y
+    return np.stack([fx * xd + cx, fy * yd + cy], axis=-1)
+
+# Pack camera matrices and distortion coefficients into an (N, N_INTRINSIC) array.
+def pack_intrinsics(cmtxs, dists):
+    intrinsics = np.zeros((len(cmtxs), N_INTRINSIC))
+    for i, (cmtx, dist) in enumerate(zip(cmtxs, dists)):
+        intrinsics[i, :4] = cmtx[0, 0], cmtx[1, 1], cmtx[0, 2], cmtx[1, 2]
+        intrinsics[i, 4:] = np.ravel(dist)[:5]
+    return intrinsics
+
+# Inverse of pack_intrinsics: return a list of camera matrices and a list of (1, 5) distortion arrays.
+def unpack_intrinsics(intrinsics):
+    cmtxs, dists = [], []
+    for fx, fy, cx, cy, *dist in intrinsics:
+        cmtxs.append(np.array([[fx, 0, cx], [0, fy, cy], [0, 0, 1]]))
+        dists.append(np.array([dist]))
+    return cmtxs, dists
+
+# Reproject every board observation. Observation m is board board_idx[m] seen by camera cam_idx[m].
+#   cameras: (N, N_CAMERA) intrinsics followed by extrinsics, poses: (B, N_POSE).
+def _reproject(cameras, poses, cam_idx, board_idx, objp):
+    # Rotations are computed once per camera / board and then gathered per observation.
+    R_board = rodrigues(poses[:, :3])[board_idx]
+    R_cam = rodrigues(cameras[:, N_INTRINSIC:N_INTRINSIC + 3])[cam_idx]
+    X_world = np.matmul(objp, R_board.transpose(0, 2, 1)) + poses[board_idx, None, 3:]
+    X_cam = np.matmul(X_world, R_cam.transpose(0, 2, 1)) + cameras[cam_idx, None, N_INTRINSIC + 3:]
+    return project_camera_points(X_cam, cameras[cam_idx, :N_INTRINSIC])
+
+def _residuals(cameras, poses, cam_idx, board_idx, objp, imgpoints):
+    return (_reproject(cameras, poses, cam_idx, board_idx, objp) - imgpoints).reshape(len(cam_idx), -1)
+
+# The Jacobian of a bundle adjustment is block sparse: the 2*P residuals of observation m only
+# depend on the N_CAMERA parameters of camera cam_idx[m] and the N_POSE parameters of board
+# board_idx[m]. Only those two dense blocks are computed, by forward differences over all
+# observations at once (one vectorized reprojection per parameter column).
+# Returns r (M, 2P), J_cam (M, 2P, N_CAMERA) and J_board (M, 2P, N_POSE).
+def _observation_jacobians(cameras, poses, cam_idx, board_idx, objp, imgpoints):
+    r = _residuals(cameras, poses, cam_idx, board_idx, objp, imgpoints)
+    J_cam = np.empty(r.shape + (N_CAMERA,))
+    J_board = np.empty(r.shape + (N_POSE,))
+    for k in range(N_CAMERA):
+        h = 1e-6 * np.maximum(1.0, np.abs(cameras[:, k]))
+        stepped = cameras.copy()
+        stepped[:, k] += h
+        J_cam[:, :, k] = (_residuals(stepped, poses, cam_idx, board_idx, objp, imgpoints) - r) / h[cam_idx, None]
+    for k in range(N_POSE):
+        h = 1e-6 * np.maximum(1.0, np.abs(poses[:, k]))
+        stepped = poses.copy()
+        stepped[:, k] += h
+        J_board[:, :, k] = (_residuals(cameras, stepped, cam_idx, board_idx, objp, imgpoints) - r) / h[board_idx, None]
+    return r, J_cam, J_board
+
+# Solve one damped Gauss-Newton step of the block-sparse normal equations
+#   [U  W] [dc]     [g_c]
+#   [W' V] [db] = - [g_b]
+# by eliminating the board poses (Schur complement). Only a small dense system in the camera
+# parameters is factorized; the 6x6 board blocks are inverted independently.
+def _schur_step(r, J_cam, J_board, cam_idx, board_idx, n_cams, n_boards, free, damping):
+    U = np.zeros((n_cams, n_cams, N_CAMERA, N_CAMERA))
+    np.add.at(U, (cam_idx, cam_idx), np.matmul(J_cam.transpose(0, 2, 1), J_cam))
+    V = np.zeros((n_boards, N_POSE, N_POSE))
+    np.add.at(V, board_idx, np.matmul(J_board.transpose(0, 2, 1), J_board))
+    W = np.matmul(J_cam.transpose(0, 2, 1), J_board)  # one (N_CAMERA, N_POSE) block per observation
+    g_cam = np.zeros((n_cams, N_CAMERA))
+    np.add.at(g_cam, cam_idx, np.einsum('mrk,mr->mk', J_cam, r))
+    g_board = np.zeros((n_boards, N_POSE))
+    np.add.at(g_board, board_idx, np.einsum('mrk,mr->mk', J_board, r))
+
+    # Marquardt damping of the diagonal. Boards without observations get an identity block.
+    counts = np.bincount(board_idx, minlength=n_boards)
+    V[counts == 0] = np.eye(N_POSE)
+    idx = np.arange(N_POSE)
+    V[:, idx, idx] *= 1 + damping
+    V_inv = np.linalg.inv(V)
+    Y = np.matmul(W, V_inv[board_idx])  # W V^-1, per observation
+
+    # Every pair of observations of the same board couples their two cameras: pair each
+    # observation m with all observations of board_idx[m].
+    order = np.argsort(board_idx, kind='stable')
+    starts = np.cumsum(counts) - counts
+    per_obs = counts[board_idx]
+    first = np.repeat(np.arange(len(board_idx)), per_obs)
+    offsets = np.arange(len(first)) - np.repeat(np.cumsum(per_obs) - per_obs, per_obs)
+    second = order[starts[board_idx[first]] + offsets]
+    S = U.copy()
+    np.add.at(S, (cam_idx[first], cam_idx[second]), -np.matmul(Y[first], W[second].transpose(0, 2, 1)))
+    S = S.transpose(0, 2, 1, 3).reshape(n_cams * N_CAMERA, n_cams * N_CAMERA)
+    rhs = -g_cam
+    np.add.at(rhs, cam_idx, np.einsum('mkp,mp->mk', Y, g_board[board_idx]))
+    rhs = rhs.ravel()
+
+    # Fixed parameters (camera0 extrinsics, optionally the intrinsics) are left out of the solve.
+    S = S[np.ix_(free, free)]
+    diag = np.arange(len(free))
+    S[diag, diag] *= 1 + damping
+    d_cam = np.zeros(n_cams * N_CAMERA)
+    d_cam[free] = np.linalg.solve(S, rhs[free])
+    d_cam = d_cam.reshape(n_cams, N_CAMERA)
+
+    Wt_dc = np.zeros((n_boards, N_POSE))
+    np.add.at(Wt_dc, board_idx, np.einsum('mkp,mk->mp', W, d_cam[cam_idx]))
+    d_board = np.einsum('bpq,bq->bp', V_inv, -g_board - Wt_dc)
+    return d_cam, d_board
+
+# Jointly refine intrinsics, extrinsics and board poses of an N-camera rig with a
+# Levenberg-Marquardt bundle adjustment.
+#   objp:        (P, 3) checkerboard corners in board coordinates.
+#   observations: list of (camera index, board index, (P, 2) image points).
+#   cmtxs, dists: initial intrinsics per camera.
+#   Rs, Ts:      initial camera extrinsics (world = camera0 frame, X_cam = R X_world + T).
+#   board_rvecs, board_tvecs: initial board poses in the camera0 frame.
+# Each iteration costs N_CAMERA + N_POSE vectorized reprojections plus one dense solve of
+# size 15 * n_cameras, so thousands of board observations take seconds.
+# The solver stops once an iteration lowers the cost by less than ftol (relative), which on
+# real footage is far below the detection noise of the checkerboard corners.
+# Returns refined cmtxs, dists, Rs, Ts and the final reprojection RMSE in pixels.
+def bundle_adjust(objp, observations, cmtxs, dists, Rs, Ts, board_rvecs, board_tvecs,
+                  fix_intrinsics=False, ftol=1e-6, max_iter=100, verbose=False):
+    n_cams = len(cmtxs)
+    n_boards = len(board_rvecs)
+    objp = np.asarray(objp, dtype=np.float64).reshape(-1, 3)
+    cam_idx = np.array([o[0] for o in observations], dtype=np.int64)
+    board_idx = np.array([o[1] for o in observations], dtype=np.int64)
+    imgpoints = np.array([np.asarray(o[2], dtype=np.float64).reshape(-1, 2) for o in observations])
+
+    cameras = np.zeros((n_cams, N_CAMERA))
+    cameras[:, :N_INTRINSIC] = pack_intrinsics(cmtxs, dists)
+    for i in range(n_cams):
+        cameras[i, N_INTRINSIC:N_INTRINSIC + 3] = cv.Rodrigues(np.asarray(Rs[i], dtype=np.float64))[0].ravel()
+        cameras[i, N_INTRINSIC + 3:] = np.ravel(Ts[i])
+    poses = np.hstack([np.asarray(board_rvecs, dtype=np.float64).reshape(-1, 3),
+                       np.asarray(board_tvecs, dtype=np.float64).reshape(-1, 3)])
+
+    free = np.ones((n_cams, N_CAMERA), dtype=bool)
+    free[0, N_INTRINSIC:] = False
+    if fix_intrinsics:
+        free[:, :N_INTRINSIC] = False
+    free = np.flatnonzero(free)
+
+    damping = 1e-3
+    r, J_cam, J_board = _observation_jacobians(cameras, poses, cam_idx, board_idx, objp, imgpoints)
+    cost = np.sum(r ** 2)
+    for iteration in range(max_iter):
+        d_cam, d_board = _schur_step(r, J_cam, J_board, cam_idx, board_idx, n_cams, n_boards, free, damping)
+        new_cameras, new_poses = cameras + d_cam, poses + d_board
+        new_cost = np.sum(_residuals(new_cameras, new_poses, cam_idx, board_idx, objp, imgpoints) ** 2)
+        if verbose:
+            print(f"  iteration {iteration}: cost {cost:.6g} -> {new_cost:.6g}, damping {damping:.1e}")
+        if new_cost < cost:
+            converged = cost - new_cost < ftol * cost
+            cameras, poses, cost = new_cameras, new_poses, new_cost
+            damping = max(damping / 10, 1e-9)
+            if converged:
+                break
+            r, J_cam, J_board = _observation_jacobians(cameras, poses, cam_idx, board_idx, objp, imgpoints)
+        else:
+            damping *= 10
+            if damping > 1e9:
+                break
+
+    cmtxs, dists = unpack_intrinsics(cameras[:, :N_INTRINSIC])
+    R_cams = rodrigues(cameras[:, N_INTRINSIC:N_INTRINSIC + 3])
+    Rs = [R_cams[i] for i in range(n_cams)]
+    Ts = [cameras[i, N_INTRINSIC + 3:].reshape(3, 1) for i in range(n_cams)]
+    rmse = np.sqrt(cost / (len(observations) * len(objp)))
+    return cmtxs, dists, Rs, Ts, rmse
@@ -1,24 +1,21 @@
 import cv2 as cv
 import numpy as np
-import sys
-from scipy import linalg
+import argparse
 import yaml
 import os
+import hashlib
+
+from bundle_adjustment import bundle_adjust
+from multiview import triangulate_points, fundamental_matrix
 
 # Global variable for calibration settings loaded from a YAML file.
 calibration_settings = {}
 
 # Given projection matrices P1 and P2, and pixel coordinates point1 and point2,
 # return the triangulated 3D point.
+# See multiview.triangulate_points for any number of cameras and batches of points.
 def DLT(P1, P2, point1, point2):
-    A = [point1[1]*P1[2, :] - P1[1, :],
-         P1[0, :] - point1[0]*P1[2, :],
-         point2[1]*P2[2, :] - P2[1, :],
-         P2[0, :] - point2[0]*P2[2, :]]
-    A = np.array(A).reshape((4, 4))
-    B = A.T @ A
-    U, s, Vh = linalg.svd(B, full_matrices=False)
-    return Vh[3, 0:3] / Vh[3, 3]
+    return triangulate_points(np.stack([P1, P2]), np.array([point1, point2], dtype=np.float64))
 
 # Open and load the calibration_settings.yaml file.
 def parse_calibration_settings_file(filename):
@@ -100,86 +97,393 @@ def save_checkerboard_detection_frames(video_path0, video_path1, output_folder,
     print("Saved", saved_count, "checkerboard detection frames to folder:", output_folder)
 
 # Given two synchronized video files, extract calibration frames from both videos.
+# Returns both cameras' intrinsics, the stereo extrinsics and the fundamental matrix F
+# (x1^T F x0 = 0 for corresponding undistorted pixels).
 def calibrate_from_videos(video_path0, video_path1, frame_sample_interval=30):
-    cap0 = cv.VideoCapture(video_path0)
-    cap1 = cv.VideoCapture(video_path1)
-    if not cap0.isOpened() or not cap1.isOpened():
-        print("Error opening one of the video files.")
-        quit()
-    
-    rows = calibration_settings['checkerboard_rows']
-    columns = calibration_settings['checkerboard_columns']
-    world_scaling = calibration_settings['checkerboard_box_size_scale']
-    criteria = (cv.TERM_CRITERIA_EPS + cv.TERM_CRITERIA_MAX_ITER, 100, 0.001)
-    
-    # Prepare object points for the checkerboard corners.
-    objp = np.zeros((rows * columns, 3), np.float32)
-    objp[:, :2] = np.mgrid[0:rows, 0:columns].T.reshape(-1, 2)
-    objp = world_scaling * objp
-
-    objpoints_cam0, imgpoints_cam0 = [], []
-    objpoints_cam1, imgpoints_cam1 = [], []
-    objpoints_stereo, imgpoints_left, imgpoints_right = [], [], []
-    
-    frame_idx = 0
-    while True:
-        ret0, frame0 = cap0.read()
-        ret1, frame1 = cap1.read()
-        if not ret0 or not ret1:
-            break
-        
-        if frame_idx % frame_sample_interval == 0:
-            gray0 = cv.cvtColor(frame0, cv.COLOR_BGR2GRAY)
-            gray1 = cv.cvtColor(frame1, cv.COLOR_BGR2GRAY)
-            
-            ret_cb0, corners0 = cv.findChessboardCorners(gray0, (rows, columns), None)
-            ret_cb1, corners1 = cv.findChessboardCorners(gray1, (rows, columns), None)
-            
-            if ret_cb0:
-                corners0 = cv.cornerSubPix(gray0, corners0, (11, 11), (-1, -1), criteria)
-                objpoints_cam0.append(objp)
-                imgpoints_cam0.append(corners0)
-            else:
-                print(f"Checkerboard not detected in video0 frame {frame_idx}")
-            
-            if ret_cb1:
-                corners1 = cv.cornerSubPix(gray1, corners1, (11, 11), (-1, -1), criteria)
-                objpoints_cam1.append(objp)
-                imgpoints_cam1.append(corners1)
-            else:
-                print(f"Checkerboard not detected in video1 frame {frame_idx}")
-            
-            if ret_cb0 and ret_cb1:
-                objpoints_stereo.append(objp)
-                imgpoints_left.append(corners0)
-                imgpoints_right.append(corners1)
-        frame_idx += 1
+    objp, corners_per_camera, img_shape = detect_board_observations([video_path0, video_path1], frame_sample_interval)
+    return calibrate_stereo_from_observations(objp, corners_per_camera, img_shape)
 
-    cap0.release()
-    cap1.release()
-    
-    if len(objpoints_cam0) < 1 or len(objpoints_cam1) < 1:
+# Stereo calibration of two cameras from detect_board_observations results.
+def calibrate_stereo_from_observations(objp, corners_per_camera, img_shape):
+    corners0, corners1 = corners_per_camera
+    criteria = (cv.TERM_CRITERIA_EPS + cv.TERM_CRITERIA_MAX_ITER, 100, 0.001)
+    if len(corners0) < 1 or len(corners1) < 1:
         print("Insufficient calibration frames detected in one or both videos.")
         quit()
-    
-    img_shape = gray0.shape[::-1]  # (width, height)
 
-    ret0, cmtx0, dist0, rvecs0, tvecs0 = cv.calibrateCamera(objpoints_cam0, imgpoints_cam0, img_shape, None, None)
+    frames0, frames1 = sorted(corners0), sorted(corners1)
+    ret0, cmtx0, dist0, rvecs0, tvecs0 = cv.calibrateCamera(
+        [objp] * len(frames0), [corners0[f] for f in frames0], img_shape, None, None)
     print("Camera0 intrinsic calibration RMSE:", ret0)
-    ret1, cmtx1, dist1, rvecs1, tvecs1 = cv.calibrateCamera(objpoints_cam1, imgpoints_cam1, img_shape, None, None)
+    ret1, cmtx1, dist1, rvecs1, tvecs1 = cv.calibrateCamera(
+        [objp] * len(frames1), [corners1[f] for f in frames1], img_shape, None, None)
     print("Camera1 intrinsic calibration RMSE:", ret1)
     
-    if len(objpoints_stereo) < 1:
+    stereo_frames = sorted(corners0.keys() & corners1.keys())
+    if len(stereo_frames) < 1:
         print("Insufficient stereo calibration pairs detected.")
         quit()
     stereocalibration_flags = cv.CALIB_FIX_INTRINSIC
     ret_stereo, CM1, dist0, CM2, dist1, R, T, E, F = cv.stereoCalibrate(
-        objpoints_stereo, imgpoints_left, imgpoints_right,
+        [objp] * len(stereo_frames),
+        [corners0[f] for f in stereo_frames],
+        [corners1[f] for f in stereo_frames],
         cmtx0, dist0, cmtx1, dist1, img_shape,
         criteria=criteria, flags=stereocalibration_flags)
     print("Stereo calibration RMSE:", ret_stereo)
     
-    return cmtx0, dist0, cmtx1, dist1, R, T
+    return cmtx0, dist0, cmtx1, dist1, R, T, F
+
+# Checkerboard corner coordinates in board units, scaled by checkerboard_box_size_scale.
+def _board_object_points():
+    rows = calibration_settings['checkerboard_rows']
+    columns = calibration_settings['checkerboard_columns']
+    world_scaling = calibration_settings['checkerboard_box_size_scale']
+    objp = np.zeros((rows * columns, 3), np.float32)
+    objp[:, :2] = np.mgrid[0:rows, 0:columns].T.reshape(-1, 2)
+    return world_scaling * objp
+
+# Open every source: video files, or camera indices such as "0" for a local stream.
+def _open_captures(sources):
+    caps = [cv.VideoCapture(int(src)) if str(src).isdigit() else cv.VideoCapture(src) for src in sources]
+    if not all(cap.isOpened() for cap in caps):
+        print("Error opening one of the video files.")
+        quit()
+    return caps
+
+# Yield (frame_idx, frames) for every sampled frame of the synchronized captures until one ends.
+def _sampled_frames(caps, frame_sample_interval):
+    frame_idx = 0
+    while True:
+        if frame_idx % frame_sample_interval != 0:
+            # Frames that are not sampled only need to be grabbed, not decoded.
+            if not all([cap.grab() for cap in caps]):
+                return
+            frame_idx += 1
+            continue
+
+        reads = [cap.read() for cap in caps]
+        if not all(ret for ret, _ in reads):
+            return
+        yield frame_idx, [frame for _, frame in reads]
+        frame_idx += 1
+
+# Find the checkerboard in one frame. Returns the image shape (width, height) and the refined
+# corners, or None if the board was not found.
+def _detect_checkerboard(frame):
+    rows = calibration_settings['checkerboard_rows']
+    columns = calibration_settings['checkerboard_columns']
+    criteria = (cv.TERM_CRITERIA_EPS + cv.TERM_CRITERIA_MAX_ITER, 100, 0.001)
+    gray = cv.cvtColor(frame, cv.COLOR_BGR2GRAY)
+    ret_cb, corners = cv.findChessboardCorners(gray, (rows, columns), None)
+    if not ret_cb:
+        return gray.shape[::-1], None
+    return gray.shape[::-1], cv.cornerSubPix(gray, corners, (11, 11), (-1, -1), criteria)
+
+# Process any number of synchronized videos and detect the checkerboard in every sampled frame.
+# Returns the checkerboard object points, one {frame_idx: corners} dict per camera and the image shape.
+def detect_board_observations(video_paths, frame_sample_interval=30):
+    caps = _open_captures(video_paths)
+    corners_per_camera = [{} for _ in caps]
+    img_shape = None
+    for frame_idx, frames in _sampled_frames(caps, frame_sample_interval):
+        for cam, frame in enumerate(frames):
+            img_shape, corners = _detect_checkerboard(frame)
+            if corners is not None:
+                corners_per_camera[cam][frame_idx] = corners
+            else:
+                print(f"Checkerboard not detected in video{cam} frame {frame_idx}")
+
+    for cap in caps:
+        cap.release()
+    return _board_object_points(), corners_per_camera, img_shape
+
+# Place every camera in the camera0 frame by chaining pairwise stereo calibrations.
+# At each step the unplaced camera sharing the most checkerboard views with an
+# already placed camera is calibrated against it.
+def _initial_rig_extrinsics(objp, corners_per_camera, cmtxs, dists, img_shape):
+    n_cams = len(corners_per_camera)
+    criteria = (cv.TERM_CRITERIA_EPS + cv.TERM_CRITERIA_MAX_ITER, 100, 0.001)
+    Rs = [np.eye(3)] + [None] * (n_cams - 1)
+    Ts = [np.zeros((3, 1))] + [None] * (n_cams - 1)
+    placed = {0}
+    while len(placed) < n_cams:
+        shared, a, b = max((len(corners_per_camera[a].keys() & corners_per_camera[b].keys()), a, b)
+                           for a in placed for b in range(n_cams) if b not in placed)
+        if shared < 1:
+            print(f"Camera{b} shares no checkerboard views with the other cameras.")
+            quit()
+        frames = sorted(corners_per_camera[a].keys() & corners_per_camera[b].keys())
+        ret_stereo, _, _, _, _, R, T, E, F = cv.stereoCalibrate(
+            [objp] * len(frames),
+            [corners_per_camera[a][f] for f in frames],
+            [corners_per_camera[b][f] for f in frames],
+            cmtxs[a], dists[a], cmtxs[b], dists[b], img_shape,
+            criteria=criteria, flags=cv.CALIB_FIX_INTRINSIC)
+        print(f"Stereo calibration RMSE (camera{a} -> camera{b}, {shared} views):", ret_stereo)
+        Rs[b] = R @ Rs[a]
+        Ts[b] = R @ Ts[a] + T
+        placed.add(b)
+    return Rs, Ts
+
+# Calibrate a rig of any number of synchronized cameras. Intrinsics are solved per camera,
+# extrinsics are initialized from pairwise stereo calibrations and everything (including the
+# checkerboard poses) is then jointly refined with a sparse bundle adjustment.
+# Camera0 defines the world frame.
+def calibrate_rig_from_videos(video_paths, frame_sample_interval=30):
+    objp, corners_per_camera, img_shape = detect_board_observations(video_paths, frame_sample_interval)
+    return calibrate_rig_from_observations(objp, corners_per_camera, img_shape)
+
+# N-camera rig calibration from detect_board_observations results.
+def calibrate_rig_from_observations(objp, corners_per_camera, img_shape):
+    if any(len(corners) < 1 for corners in corners_per_camera):
+        print("Insufficient calibration frames detected in one or more videos.")
+        quit()
+
+    cmtxs, dists = [], []
+    for cam, corners in enumerate(corners_per_camera):
+        frames = sorted(corners)
+        ret, cmtx, dist, rvecs, tvecs = cv.calibrateCamera(
+            [objp] * len(frames), [corners[f] for f in frames], img_shape, None, None)
+        print(f"Camera{cam} intrinsic calibration RMSE:", ret)
+        cmtxs.append(cmtx)
+        dists.append(dist)
+
+    Rs, Ts = _initial_rig_extrinsics(objp, corners_per_camera, cmtxs, dists, img_shape)
+
+    # Initial checkerboard poses in the camera0 frame, from the first camera that saw each board.
+    observations, board_rvecs, board_tvecs = [], [], []
+    frame_ids = sorted(set().union(*[corners.keys() for corners in corners_per_camera]))
+    for board, f in enumerate(frame_ids):
+        cams = [cam for cam, corners in enumerate(corners_per_camera) if f in corners]
+        ref = cams[0]
+        _, rvec, tvec = cv.solvePnP(objp, corners_per_camera[ref][f], cmtxs[ref], dists[ref])
+        R_board = Rs[ref].T @ cv.Rodrigues(rvec)[0]
+        board_rvecs.append(cv.Rodrigues(R_board)[0].ravel())
+        board_tvecs.append((Rs[ref].T @ (tvec - Ts[ref])).ravel())
+        for cam in cams:
+            observations.append((cam, board, corners_per_camera[cam][f]))
+
+    print(f"Bundle adjustment over {len(observations)} board observations from {len(corners_per_camera)} cameras...")
+    cmtxs, dists, Rs, Ts, rmse = bundle_adjust(objp, observations, cmtxs, dists, Rs, Ts,
+                                               board_rvecs, board_tvecs)
+    print("Bundle adjustment RMSE:", rmse)
+    return cmtxs, dists, Rs, Ts
+
+# Recalibrate after a small rig change without starting from zero. The results of the last run
+# in `folder` are used as the initial guess, the checkerboard is only detected in the new
+# footage, and the new views are merged with the cached views of earlier runs.
+# Moving a phone does not change its intrinsics, so they are refined on all views; the
+# extrinsics of camera1..N-1 are refined from the new footage only.
+# Returns the intrinsics and extrinsics of every camera and the fundamental matrices between
+# camera0 and each camera (None for camera0 itself).
+def recalibrate_incremental(video_paths, frame_sample_interval=30, folder='camera_parameters'):
+    n_cams = len(video_paths)
+    cmtxs, dists, Rs, Ts = [], [], [], []
+    for cam in range(n_cams):
+        cmtx, dist = load_camera_intrinsics(f'camera{cam}', folder)
+        R, T = load_camera_extrinsics(f'camera{cam}', folder)
+        cmtxs.append(cmtx)
+        dists.append(dist)
+        Rs.append(R)
+        Ts.append(T)
+
+    objp, new_corners, img_shape = detect_board_observations(video_paths, frame_sample_interval)
+    cached_corners = [{} for _ in range(n_cams)]
+    cache_file = os.path.join(folder, 'board_observations.npz')
+    if os.path.exists(cache_file):
+        _, cached, cached_shape = load_board_observations(cache_file)
+        # The previous intrinsics and cached corners are in pixels of the old footage, so the
+        # new clip must have been recorded at the same resolution.
+        if img_shape is not None and tuple(img_shape) != cached_shape:
+            print(f"The new videos are {img_shape[0]}x{img_shape[1]} but the cameras were calibrated at "
+                  f"{cached_shape[0]}x{cached_shape[1]}. Record at the same resolution or calibrate from zero.")
+            quit()
+        if len(cached) == n_cams:
+            cached_corners = cached
+        else:
+            print(f"Ignoring cached observations of {len(cached)} cameras for a {n_cams} camera rig.")
+    # Give the new views frame ids after the cached ones so both sets can be merged.
+    offset = 1 + max([f for corners in cached_corners for f in corners], default=-1)
+    new_corners = [{offset + f: c for f, c in corners.items()} for corners in new_corners]
+    # Views already in the cache (e.g. from running again on the same clip) are not added twice,
+    # so the cache and the intrinsic refinement only grow with genuinely new footage.
+    seen = [{c.tobytes() for c in cached.values()} for cached in cached_corners]
+    duplicates = {f for corners in new_corners for f in corners
+                  if all(corners[f].tobytes() in seen[cam] for cam, corners in enumerate(new_corners) if f in corners)}
+    if duplicates:
+        print(f"Skipping {len(duplicates)} views that are already cached.")
+    merged_corners = [{**cached, **{f: c for f, c in new.items() if f not in duplicates}}
+                      for cached, new in zip(cached_corners, new_corners)]
+
+    # Starting from a good guess only a few iterations are needed.
+    criteria = (cv.TERM_CRITERIA_EPS + cv.TERM_CRITERIA_MAX_ITER, 30, 1e-6)
+    for cam, corners in enumerate(merged_corners):
+        frames = sorted(corners)
+        if len(frames) < 1:
+            print(f"No checkerboard views for camera{cam}, keeping its previous intrinsics.")
+            continue
+        ret, cmtxs[cam], dists[cam], _, _ = cv.calibrateCamera(
+            [objp] * len(frames), [corners[f] for f in frames], img_shape, cmtxs[cam], dists[cam],
+            flags=cv.CALIB_USE_INTRINSIC_GUESS, criteria=criteria)
+        print(f"Camera{cam} intrinsic calibration RMSE ({len(frames)} views):", ret)
+
+    # Each camera is refined against the already refined camera it shares the most new views
+    # with, starting from camera0, using the previous relative pose as the guess.
+    Fs = [None] * n_cams
+    placed, remaining = [0], list(range(1, n_cams))
+    while remaining:
+        shared, a, b = max((len(new_corners[a].keys() & new_corners[b].keys()), a, b)
+                           for a in placed for b in remaining)
+        remaining.remove(b)
+        placed.append(b)
+        if shared < 1:
+            print(f"Camera{b} shares no new checkerboard views with the other cameras, keeping its previous extrinsics.")
+            Fs[b] = fundamental_matrix(cmtxs[0], cmtxs[b], Rs[b], Ts[b])
+            continue
+        frames = sorted(new_corners[a].keys() & new_corners[b].keys())
+        R_guess = Rs[b] @ Rs[a].T
+        T_guess = Ts[b] - R_guess @ Ts[a]
+        # Only stereoCalibrateExtended accepts CALIB_USE_EXTRINSIC_GUESS.
+        result = cv.stereoCalibrateExtended(
+            [objp] * len(frames),
+            [new_corners[a][f] for f in frames],
+            [new_corners[b][f] for f in frames],
+            cmtxs[a], dists[a], cmtxs[b], dists[b], img_shape,
+            np.asarray(R_guess, dtype=np.float64), np.asarray(T_guess, dtype=np.float64),
+            criteria=criteria, flags=cv.CALIB_FIX_INTRINSIC | cv.CALIB_USE_EXTRINSIC_GUESS)
+        ret_stereo, R, T, F = result[0], result[5], result[6], result[8]
+        print(f"Stereo calibration RMSE (camera{a} -> camera{b}, {len(frames)} views):", ret_stereo)
+        Rs[b] = R @ Rs[a]
+        Ts[b] = R @ Ts[a] + T
+        Fs[b] = F if a == 0 else fundamental_matrix(cmtxs[0], cmtxs[b], Rs[b], Ts[b])
+
+    save_board_observations(objp, merged_corners, img_shape, cache_file)
+    return cmtxs, dists, Rs, Ts, Fs
+
+# Fraction of the image covered by detected checkerboard corners, measured on a coarse grid.
+def board_coverage(corners, img_shape, grid=(8, 6)):
+    if not corners:
+        return 0.0
+    points = np.concatenate([c.reshape(-1, 2) for c in corners.values()])
+    cells_x = np.clip((points[:, 0] / img_shape[0] * grid[0]).astype(int), 0, grid[0] - 1)
+    cells_y = np.clip((points[:, 1] / img_shape[1] * grid[1]).astype(int), 0, grid[1] - 1)
+    return len(np.unique(cells_y * grid[0] + cells_x)) / (grid[0] * grid[1])
+
+# Solve the rig from the views collected so far, warm-started from the previous solution if any.
+# Camera1..N-1 are calibrated directly against camera0.
+# Returns (cmtxs, dists, Rs, Ts, Fs, rmse) where rmse is the largest intrinsic or stereo RMSE.
+def _solve_streaming(objp, corners_per_camera, img_shape, previous=None):
+    criteria = (cv.TERM_CRITERIA_EPS + cv.TERM_CRITERIA_MAX_ITER, 30, 1e-6)
+    cmtxs, dists, rmse = [], [], 0.0
+    for cam, corners in enumerate(corners_per_camera):
+        frames = sorted(corners)
+        if previous is None:
+            ret, cmtx, dist, _, _ = cv.calibrateCamera(
+                [objp] * len(frames), [corners[f] for f in frames], img_shape, None, None)
+        else:
+            ret, cmtx, dist, _, _ = cv.calibrateCamera(
+                [objp] * len(frames), [corners[f] for f in frames], img_shape,
+                previous[0][cam].copy(), previous[1][cam].copy(),
+                flags=cv.CALIB_USE_INTRINSIC_GUESS, criteria=criteria)
+        cmtxs.append(cmtx)
+        dists.append(dist)
+        rmse = max(rmse, ret)
+
+    Rs, Ts, Fs = [np.eye(3)], [np.zeros((3, 1))], [None]
+    for cam in range(1, len(corners_per_camera)):
+        frames = sorted(corners_per_camera[0].keys() & corners_per_camera[cam].keys())
+        args = ([objp] * len(frames),
+                [corners_per_camera[0][f] for f in frames],
+                [corners_per_camera[cam][f] for f in frames],
+                cmtxs[0], dists[0], cmtxs[cam], dists[cam], img_shape)
+        if previous is None:
+            result = cv.stereoCalibrate(*args, criteria=criteria, flags=cv.CALIB_FIX_INTRINSIC)
+        else:
+            result = cv.stereoCalibrateExtended(*args, previous[2][cam].copy(), previous[3][cam].copy(), criteria=criteria,
+                                                flags=cv.CALIB_FIX_INTRINSIC | cv.CALIB_USE_EXTRINSIC_GUESS)
+        Rs.append(result[5])
+        Ts.append(result[6])
+        Fs.append(result[8])
+        rmse = max(rmse, result[0])
+    return cmtxs, dists, Rs, Ts, Fs, rmse
+
+# Largest relative change between two streaming solutions: camera matrix entries relative to
+# the focal length, stereo translations relative to their length and rotations in radians.
+def _parameter_change(previous, current):
+    change = 0.0
+    for cmtx_old, cmtx_new in zip(previous[0], current[0]):
+        change = max(change, np.max(np.abs(cmtx_new - cmtx_old)) / cmtx_old[0, 0])
+    for R_old, R_new, T_old, T_new in zip(previous[2][1:], current[2][1:], previous[3][1:], current[3][1:]):
+        change = max(change, np.linalg.norm(T_new - T_old) / np.linalg.norm(T_old))
+        change = max(change, np.linalg.norm(cv.Rodrigues(R_new @ R_old.T)[0]))
+    return change
+
+# Calibrate while decoding and stop as soon as the estimates have converged. Sources are video
+# files or camera indices (e.g. "0") for a local stream. Once every camera shares min_views
+# checkerboard views with camera0 the rig is re-solved after every solve_interval new stereo
+# views, warm-started from the previous solve; before that the views collected so far and the
+# checkerboard coverage are printed at the same interval. Decoding stops when `patience` consecutive
+# solves change the parameters by less than `tolerance` (see _parameter_change). The RMSE is
+# reported but not used to decide, it keeps fluctuating as views are added.
+# Returns the intrinsics and extrinsics of every camera and the fundamental matrices between
+# camera0 and each camera (None for camera0 itself).
+def calibrate_streaming(sources, frame_sample_interval=30, min_views=10, solve_interval=5,
+                        tolerance=0.005, patience=3):
+    caps = _open_captures(sources)
+    objp = _board_object_points()
+    corners_per_camera = [{} for _ in caps]
+    img_shape = None
+    solution = None
+    stable_solves = 0
+    new_views = 0
+    for frame_idx, frames in _sampled_frames(caps, frame_sample_interval):
+        for cam, frame in enumerate(frames):
+            img_shape, corners = _detect_checkerboard(frame)
+            if corners is not None:
+                corners_per_camera[cam][frame_idx] = corners
+        if frame_idx in corners_per_camera[0] and any(frame_idx in c for c in corners_per_camera[1:]):
+            new_views += 1
+
+        shared = min(len(corners_per_camera[0].keys() & c.keys()) for c in corners_per_camera[1:])
+        # The first solve happens as soon as there are enough views, later ones every solve_interval.
+        if new_views < solve_interval and not (solution is None and shared >= min_views):
+            continue
+        new_views = 0
+        coverage = ', '.join(f"camera{cam} {100 * board_coverage(c, img_shape):.0f}%"
+                             for cam, c in enumerate(corners_per_camera))
+        if shared < min_views:
+            # Not enough views to solve yet, report progress so a stream that never gets there
+            # does not stay silent.
+            print(f"Frame {frame_idx}: {shared} of {min_views} stereo views, coverage: {coverage}")
+            continue
+        current = _solve_streaming(objp, corners_per_camera, img_shape, solution)
+        if solution is None:
+            print(f"Frame {frame_idx}: {shared} stereo views, RMSE {current[-1]:.4f}, coverage: {coverage}")
+        else:
+            change = _parameter_change(solution, current)
+            stable_solves = stable_solves + 1 if change < tolerance else 0
+            print(f"Frame {frame_idx}: {shared} stereo views, RMSE {current[-1]:.4f}, "
+                  f"parameter change {change:.4f}, coverage: {coverage}")
+        solution = current
+        if stable_solves >= patience:
+            print(f"Calibration converged after {frame_idx + 1} frames, stopping.")
+            break
+
+    for cap in caps:
+        cap.release()
+    if solution is None or new_views > 0:
+        # The stream ended before converging: solve once more on everything that was collected.
+        if any(len(c) < 1 for c in corners_per_camera) or \
+                min(len(corners_per_camera[0].keys() & c.keys()) for c in corners_per_camera[1:]) < 1:
+            print("Insufficient calibration frames detected in one or more videos.")
+            quit()
+        solution = _solve_streaming(objp, corners_per_camera, img_shape, solution)
+    print("Calibration RMSE:", solution[-1])
+
+    save_board_observations(objp, corners_per_camera, img_shape)
+    cmtxs, dists, Rs, Ts, Fs, _ = solution
+    return cmtxs, dists, Rs, Ts, Fs
 
 # Converts a rotation matrix R and translation vector T into a homogeneous representation matrix.
 def _make_homogeneous_rep_matrix(R, t):
@@ -193,70 +497,262 @@ def _make_homogeneous_rep_matrix(R, t):
 def get_projection_matrix(cmtx, R, T):
     return cmtx @ _make_homogeneous_rep_matrix(R, T)[:3, :]
 
+# Save the intrinsic parameters of one camera to camera_parameters/<camera_name>_intrinsics.dat.
+def save_camera_intrinsics(camera_matrix, distortion_coefs, camera_name):
+    if not os.path.exists('camera_parameters'):
+        os.mkdir('camera_parameters')
+    out_filename = os.path.join('camera_parameters', camera_name + '_intrinsics.dat')
+    with open(out_filename, 'w') as outf:
+        outf.write('Intrinsic:\n')
+        for row in camera_matrix:
+            outf.write(' '.join(map(str, row)) + '\n')
+        outf.write('Distortion:\n')
+        outf.write(' '.join(map(str, distortion_coefs[0])) + '\n')
+
+# Save the rotation and translation of one camera to camera_parameters/<prefix><camera_name>_rot_trans.dat.
+def save_camera_extrinsics(R, T, camera_name, prefix=''):
+    if not os.path.exists('camera_parameters'):
+        os.mkdir('camera_parameters')
+    out_filename = os.path.join('camera_parameters', prefix + camera_name + '_rot_trans.dat')
+    with open(out_filename, 'w') as outf:
+        outf.write('R:\n')
+        for row in R:
+            outf.write(' '.join(map(str, row)) + '\n')
+        outf.write('T:\n')
+        outf.write(' '.join(map(str, T.flatten())) + '\n')
+
+# Save the fundamental matrix between two cameras to camera_parameters/<pair_name>_fundamental.dat.
+def save_fundamental_matrix(F, pair_name):
+    if not os.path.exists('camera_parameters'):
+        os.mkdir('camera_parameters')
+    out_filename = os.path.join('camera_parameters', pair_name + '_fundamental.dat')
+    with open(out_filename, 'w') as outf:
+        outf.write('F:\n')
+        for row in F:
+            outf.write(' '.join(map(str, row)) + '\n')
+
+# Load the camera matrix and (1, 5) distortion coefficients saved by save_camera_intrinsics.
+def load_camera_intrinsics(camera_name, folder='camera_parameters'):
+    with open(os.path.join(folder, camera_name + '_intrinsics.dat')) as inf:
+        lines = [line.split() for line in inf]
+    camera_matrix = np.array(lines[1:4], dtype=np.float64)
+    distortion_coefs = np.array([lines[5]], dtype=np.float64)
+    return camera_matrix, distortion_coefs
+
+# Load the rotation matrix and (3, 1) translation vector saved by save_camera_extrinsics.
+def load_camera_extrinsics(camera_name, folder='camera_parameters', prefix=''):
+    with open(os.path.join(folder, prefix + camera_name + '_rot_trans.dat')) as inf:
+        lines = [line.split() for line in inf]
+    R = np.array(lines[1:4], dtype=np.float64)
+    T = np.array(lines[5], dtype=np.float64).reshape(3, 1)
+    return R, T
+
+# Load the fundamental matrix saved by save_fundamental_matrix.
+def load_fundamental_matrix(pair_name, folder='camera_parameters'):
+    with open(os.path.join(folder, pair_name + '_fundamental.dat')) as inf:
+        lines = [line.split() for line in inf]
+    return np.array(lines[1:4], dtype=np.float64)
+
+# Cache the detected checkerboard corners so later runs can reuse them (see --incremental).
+def save_board_observations(objp, corners_per_camera, img_shape,
+                            filename=os.path.join('camera_parameters', 'board_observations.npz')):
+    if not os.path.exists(os.path.dirname(filename)):
+        os.mkdir(os.path.dirname(filename))
+    arrays = {'objp': objp, 'img_shape': np.array(img_shape)}
+    for cam, corners in enumerate(corners_per_camera):
+        frames = sorted(corners)
+        arrays[f'camera{cam}_frames'] = np.array(frames, dtype=np.int64)
+        arrays[f'camera{cam}_corners'] = np.array([corners[f] for f in frames], dtype=np.float32).reshape(len(frames), len(objp), 1, 2)
+    np.savez_compressed(filename, **arrays)
+
+# Load the checkerboard corners saved by save_board_observations.
+def load_board_observations(filename=os.path.join('camera_parameters', 'board_observations.npz')):
+    with np.load(filename) as data:
+        objp = data['objp']
+        img_shape = tuple(int(v) for v in data['img_shape'])
+        corners_per_camera = []
+        cam = 0
+        while f'camera{cam}_frames' in data:
+            frames, corners = data[f'camera{cam}_frames'], data[f'camera{cam}_corners']
+            corners_per_camera.append({int(f): c for f, c in zip(frames, corners)})
+            cam += 1
+    return objp, corners_per_camera, img_shape
+
+# Hash of the calibration a set of rectification maps was built from, to detect stale maps.
+def _calibration_fingerprint(cmtx0, dist0, cmtx1, dist1, R, T, img_shape):
+    params = [np.asarray(p, dtype=np.float64).ravel() for p in (cmtx0, dist0, cmtx1, dist1, R, T, img_shape)]
+    return hashlib.sha1(np.round(np.concatenate(params), 9).tobytes()).hexdigest()
+
+# Rectify a calibrated pair (camera1 at X1 = R X0 + T) and build the undistort + rectify lookup
+# tables of both cameras. The maps are CV_16SC2 fixed-point tables (int16 source pixels plus
+# a uint16 interpolation index), 6 bytes per pixel instead of 8 for float maps.
+# Returns a dict with both intrinsics, the rectification rotations R0/R1, the rectified
+# projection matrices P0/P1 (in rectified camera0 coordinates), Q, the maps and the
+# calibration fingerprint.
+def compute_rectification(cmtx0, dist0, cmtx1, dist1, R, T, img_shape):
+    R0, R1, P0, P1, Q, _, _ = cv.stereoRectify(cmtx0, dist0, cmtx1, dist1, img_shape, R, T, alpha=0)
+    rect = {'img_shape': np.array(img_shape), 'cmtx0': cmtx0, 'dist0': dist0, 'cmtx1': cmtx1, 'dist1': dist1,
+            'R0': R0, 'R1': R1, 'P0': P0, 'P1': P1, 'Q': Q,
+            'fingerprint': np.array(_calibration_fingerprint(cmtx0, dist0, cmtx1, dist1, R, T, img_shape))}
+    for cam, (cmtx, dist, R_rect, P_rect) in enumerate([(cmtx0, dist0, R0, P0), (cmtx1, dist1, R1, P1)]):
+        map_xy, map_interp = cv.initUndistortRectifyMap(cmtx, dist, R_rect, P_rect, img_shape, cv.CV_16SC2)
+        rect[f'map{cam}_xy'] = map_xy
+        rect[f'map{cam}_interp'] = map_interp
+    return rect
+
+# Save the rectification of a pair to <folder>/<pair_name>_rectification.npz. The file is
+# left uncompressed: loading it is then about as fast as reading raw arrays.
+def save_rectification(rect, pair_name, folder='camera_parameters'):
+    if not os.path.exists(folder):
+        os.mkdir(folder)
+    np.savez(os.path.join(folder, pair_name + '_rectification.npz'), **rect)
+
+# Load the rectification saved by save_rectification, or None if there is none.
+def load_rectification(pair_name, folder='camera_parameters'):
+    filename = os.path.join(folder, pair_name + '_rectification.npz')
+    if not os.path.exists(filename):
+        return None
+    with np.load(filename) as data:
+        return {key: data[key] for key in data.files}
+
+# Rectification of camera0 and camera<cam> from the calibration in `folder`. The maps are only
+# built when the cached ones are missing or were built from a different calibration, so
+# repeated runs just load them.
+def get_rectification(cam, img_shape, folder='camera_parameters'):
+    pair_name = f'camera0_camera{cam}'
+    cmtx0, dist0 = load_camera_intrinsics('camera0', folder)
+    cmtx1, dist1 = load_camera_intrinsics(f'camera{cam}', folder)
+    R, T = load_camera_extrinsics(f'camera{cam}', folder)
+    rect = load_rectification(pair_name, folder)
+    if rect is not None and str(rect['fingerprint']) == _calibration_fingerprint(cmtx0, dist0, cmtx1, dist1, R, T, img_shape):
+        return rect
+    print(f"Building rectification maps for {pair_name}.")
+    rect = compute_rectification(cmtx0, dist0, cmtx1, dist1, R, T, img_shape)
+    save_rectification(rect, pair_name, folder)
+    return rect
+
+# Rectified projection matrices (2, 3, 4) of a pair, for points in camera0 coordinates.
+def rectified_projection_matrices(rect):
+    to_rectified = np.eye(4)
+    to_rectified[:3, :3] = rect['R0']
+    return np.stack([rect['P0'] @ to_rectified, rect['P1'] @ to_rectified])
+
+# Undistort and rectify a pair of frames with the cached maps and put them side by side.
+# Horizontal guide lines every `line_spacing` pixels make it easy to check that corresponding
+# points share a row.
+def rectify_pair(frame0, frame1, rect, line_spacing=40):
+    rectified = [cv.remap(frame, rect[f'map{cam}_xy'], rect[f'map{cam}_interp'], cv.INTER_LINEAR)
+                 for cam, frame in enumerate((frame0, frame1))]
+    combined = cv.hconcat(rectified)
+    if line_spacing:
+        for y in range(line_spacing, combined.shape[0], line_spacing):
+            cv.line(combined, (0, y), (combined.shape[1] - 1, y), (0, 255, 0), 1)
+    return combined
+
+# Save rectified side-by-side previews of the sampled frames of two synchronized videos.
+# With corners_per_camera (from detect_board_observations) only frames with a checkerboard
+# are saved and the detected corners are drawn at their rectified positions.
+def save_rectified_frames(video_path0, video_path1, rect, output_folder, frame_sample_interval=30,
+                          corners_per_camera=None):
+    if not os.path.exists(output_folder):
+        os.mkdir(output_folder)
+    rows = calibration_settings['checkerboard_rows']
+    columns = calibration_settings['checkerboard_columns']
+    width = int(rect['img_shape'][0])
+
+    caps = _open_captures([video_path0, video_path1])
+    saved_count = 0
+    for frame_idx, frames in _sampled_frames(caps, frame_sample_interval):
+        if corners_per_camera is not None and not any(frame_idx in corners for corners in corners_per_camera):
+            continue
+        combined = rectify_pair(frames[0], frames[1], rect)
+        if corners_per_camera is not None:
+            for cam, corners in enumerate(corners_per_camera):
+                if frame_idx not in corners:
+                    continue
+                rectified = cv.undistortPoints(corners[frame_idx], rect[f'cmtx{cam}'], rect[f'dist{cam}'],
+                                               R=rect[f'R{cam}'], P=rect[f'P{cam}'])
+                rectified[..., 0] += cam * width
+                cv.drawChessboardCorners(combined, (rows, columns), rectified.astype(np.float32), True)
+        cv.imwrite(os.path.join(output_folder, f"frame_{saved_count:04d}.png"), combined)
+        saved_count += 1
+
+    for cap in caps:
+        cap.release()
+    print("Saved", saved_count, "rectified frames to folder:", output_folder)
+
 if __name__ == '__main__':
     # Expected usage:
-    # python3 calibrate.py calibration_settings.yaml <video_path0> <video_path1>
-    if len(sys.argv) != 4:
-        print("Usage: python3 calibrate.py calibration_settings.yaml <video_path0> <video_path1>")
-        quit()
+    # python3 calib.py calibration_settings.yaml <video_path0> <video_path1> [<video_path2> ...] [--incremental | --live]
+    parser = argparse.ArgumentParser(description="Calibrate two or more synchronized cameras from checkerboard videos.")
+    parser.add_argument("settings_file", help="Path to calibration_settings.yaml.")
+    parser.add_argument("video_paths", nargs="+", help="Synchronized calibration videos, camera0 first.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--incremental", action="store_true",
+                      help="Refine the results in camera_parameters/ with the new footage instead of calibrating from zero.")
+    mode.add_argument("--live", action="store_true",
+                      help="Re-solve while decoding and stop once the calibration has converged. "
+                           "Sources may also be camera indices such as 0.")
+    args = parser.parse_args()
+    if len(args.video_paths) < 2:
+        parser.error("At least two videos are needed.")
     
-    settings_file = sys.argv[1]
-    video_path0 = sys.argv[2]
-    video_path1 = sys.argv[3]
-    
-    parse_calibration_settings_file(settings_file)
+    video_paths = args.video_paths
+    n_cams = len(video_paths)
+    parse_calibration_settings_file(args.settings_file)
     
     # Use frame_sample_interval from YAML if available, default to 30.
     frame_sample_interval = calibration_settings.get('video_frame_interval', 30)
     
-    # Save side-by-side frames where at least one checkerboard is found.
-    output_folder = "checkerboard_frames"
-    save_checkerboard_detection_frames(video_path0, video_path1, output_folder, frame_sample_interval)
-    
-    # Next, perform calibration.
-    cmtx0, dist0, cmtx1, dist1, R, T = calibrate_from_videos(video_path0, video_path1, frame_sample_interval)
+    if args.incremental:
+        cmtxs, dists, Rs, Ts, Fs = recalibrate_incremental(video_paths, frame_sample_interval)
+    elif args.live:
+        min_views = calibration_settings.get('stereo_calibration_frames', 10)
+        cmtxs, dists, Rs, Ts, Fs = calibrate_streaming(video_paths, frame_sample_interval, min_views)
+    else:
+        if n_cams == 2:
+            # Save side-by-side frames where at least one checkerboard is found.
+            output_folder = "checkerboard_frames"
+            save_checkerboard_detection_frames(video_paths[0], video_paths[1], output_folder, frame_sample_interval)
+        
+        objp, corners_per_camera, img_shape = detect_board_observations(video_paths, frame_sample_interval)
+        if n_cams == 2:
+            cmtx0, dist0, cmtx1, dist1, R, T, F = calibrate_stereo_from_observations(objp, corners_per_camera, img_shape)
+            cmtxs, dists = [cmtx0, cmtx1], [dist0, dist1]
+            Rs, Ts = [np.eye(3, dtype=np.float32), R], [np.zeros((3, 1), dtype=np.float32), T]
+            Fs = [None, F]
+        else:
+            # N-camera rig: pairwise initialization followed by bundle adjustment.
+            cmtxs, dists, Rs, Ts = calibrate_rig_from_observations(objp, corners_per_camera, img_shape)
+            Fs = [None] + [fundamental_matrix(cmtxs[0], cmtxs[cam], Rs[cam], Ts[cam]) for cam in range(1, n_cams)]
+        # Only cache observations that were good enough to calibrate from.
+        save_board_observations(objp, corners_per_camera, img_shape)
     
     # Save calibration parameters.
-    if not os.path.exists('camera_parameters'):
-        os.mkdir('camera_parameters')
-    def save_camera_intrinsics(camera_matrix, distortion_coefs, camera_name):
-        out_filename = os.path.join('camera_parameters', camera_name + '_intrinsics.dat')
-        with open(out_filename, 'w') as outf:
-            outf.write('Intrinsic:\n')
-            for row in camera_matrix:
-                outf.write(' '.join(map(str, row)) + '\n')
-            outf.write('Distortion:\n')
-            outf.write(' '.join(map(str, distortion_coefs[0])) + '\n')
-    save_camera_intrinsics(cmtx0, dist0, 'camera0')
-    save_camera_intrinsics(cmtx1, dist1, 'camera1')
-    
-    def save_extrinsic_calibration_parameters(R0, T0, R1, T1, prefix=''):
-        cam0_file = os.path.join('camera_parameters', prefix + 'camera0_rot_trans.dat')
-        with open(cam0_file, 'w') as outf:
-            outf.write('R:\n')
-            for row in R0:
-                outf.write(' '.join(map(str, row)) + '\n')
-            outf.write('T:\n')
-            outf.write(' '.join(map(str, T0.flatten())) + '\n')
-        cam1_file = os.path.join('camera_parameters', prefix + 'camera1_rot_trans.dat')
-        with open(cam1_file, 'w') as outf:
-            outf.write('R:\n')
-            for row in R1:
-                outf.write(' '.join(map(str, row)) + '\n')
-            outf.write('T:\n')
-            outf.write(' '.join(map(str, T1.flatten())) + '\n')
-        return R0, T0, R1, T1
-    R0 = np.eye(3, dtype=np.float32)
-    T0 = np.zeros((3, 1), dtype=np.float32)
-    save_extrinsic_calibration_parameters(R0, T0, R, T)
-    R1, T1 = R, T
-    
+    for cam in range(n_cams):
+        save_camera_intrinsics(cmtxs[cam], dists[cam], f'camera{cam}')
+        save_camera_extrinsics(Rs[cam], Ts[cam], f'camera{cam}')
+        if cam > 0:
+            save_fundamental_matrix(Fs[cam], f'camera0_camera{cam}')
+
+    # Rectify every pair with camera0. The maps are cached next to the parameters and only
+    # rebuilt when the calibration changed.
+    if args.incremental or args.live:
+        _, _, img_shape = load_board_observations()
+    for cam in range(1, n_cams):
+        rect = get_rectification(cam, img_shape)
+        if not args.live:
+            # Rectified previews: corresponding corners should share a row.
+            corners = [corners_per_camera[0], corners_per_camera[cam]] if not args.incremental else None
+            output_folder = "rectified_frames" if n_cams == 2 else f"rectified_frames_camera{cam}"
+            save_rectified_frames(video_paths[0], video_paths[cam], rect, output_folder, frame_sample_interval, corners)
+
     # Display calibration parameters.
     print("\n--- Calibration Parameters ---")
-    print("Camera0 Intrinsic Matrix:\n", cmtx0)
-    print("Camera0 Distortion Coefficients:\n", dist0)
-    print("Camera1 Intrinsic Matrix:\n", cmtx1)
-    print("Camera1 Distortion Coefficients:\n", dist1)
-    print("Stereo Rotation Matrix (Camera0 -> Camera1):\n", R)
-    print("Stereo Translation Vector (Camera0 -> Camera1):\n", T)
+    for cam in range(n_cams):
+        print(f"Camera{cam} Intrinsic Matrix:\n", cmtxs[cam])
+        print(f"Camera{cam} Distortion Coefficients:\n", dists[cam])
+    for cam in range(1, n_cams):
+        print(f"Stereo Rotation Matrix (Camera0 -> Camera{cam}):\n", Rs[cam])
+        print(f"Stereo Translation Vector (Camera0 -> Camera{cam}):\n", Ts[cam])
     print("------------------------------\n")
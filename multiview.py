@@ -0,0 +1,144 @@
+import numpy as np
+
+# Views that can be used for a point: detected, visible and with a positive weight.
+def _usable_views(points, weights, visible):
+    usable = ~np.isnan(points).any(axis=-1)
+    if visible is not None:
+        usable &= np.asarray(visible, dtype=bool)
+    w = np.ones(points.shape[:-1]) if weights is None else np.nan_to_num(np.asarray(weights, dtype=np.float64))
+    w = np.where(usable, w, 0.0)
+    return usable & (w > 0), w
+
+# Triangulate points observed by any number of cameras with a weighted DLT.
+#   Ps:      (C, 3, 4) projection matrices.
+#   points:  (..., C, 2) pixel coordinates per view, NaN where the point was not detected.
+#   weights: optional (..., C) per-view confidence weights (e.g. the _c columns).
+#   visible: optional (..., C) boolean visibility mask.
+# All leading dimensions (typically frames x landmarks) are solved at once: each view adds its
+# weighted 4x4 block to the normal matrix of its point and a single batched 4x4 eigen
+# decomposition solves everything, so the cost grows only slightly with the number of cameras.
+# Returns (..., 3) points, NaN where fewer than two views are usable.
+def triangulate_points(Ps, points, weights=None, visible=None):
+    Ps = np.asarray(Ps, dtype=np.float64)
+    points = np.asarray(points, dtype=np.float64)
+    usable, w = _usable_views(points, weights, visible)
+    xy = np.where(usable[..., None], points, 0.0)
+
+    # Two DLT rows per view: x * P[2] - P[0] and y * P[2] - P[1].
+    A = xy[..., :, None] * Ps[:, 2, None, :] - Ps[:, :2, :]  # (..., C, 2, 4)
+    A /= np.maximum(np.linalg.norm(A, axis=-1, keepdims=True), 1e-12)
+    A *= np.sqrt(w)[..., None, None]
+    M = np.einsum('...cri,...crj->...ij', A, A)
+
+    _, vecs = np.linalg.eigh(M)
+    X = vecs[..., :, 0]  # eigenvector of the smallest eigenvalue
+    with np.errstate(divide='ignore', invalid='ignore'):
+        X = X[..., :3] / X[..., 3:]
+    X[usable.sum(axis=-1) < 2] = np.nan
+    return X
+
+# Project (..., 3) points with every camera. Returns pixels (..., C, 2) and depths (..., C).
+def _project(Ps, X):
+    Xh = np.concatenate([X, np.ones(X.shape[:-1] + (1,))], axis=-1)
+    x = np.einsum('cij,...j->...ci', Ps, Xh)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return x[..., :2] / x[..., 2:], x[..., 2]
+
+# Refine triangulated points by minimizing their confidence-weighted reprojection error.
+#   Ps, points, weights, visible: as in triangulate_points.
+#   X0: (..., 3) initial points, usually the triangulate_points result.
+# Every point is an independent 3-parameter problem, so all of them take their
+# Levenberg-Marquardt steps together: the analytic Jacobians, the 3x3 normal equations and
+# the per-point damping are all arrays over the leading (frames x landmarks) dimensions.
+# Returns the refined points (..., 3), the per-view reprojection error in pixels (..., C)
+# (NaN for unused views) and the per-point weighted RMS reprojection error (...), NaN where
+# the point could not be triangulated.
+def refine_points(Ps, points, X0, weights=None, visible=None, max_iter=10, tol=1e-6):
+    Ps = np.asarray(Ps, dtype=np.float64)
+    points = np.asarray(points, dtype=np.float64)
+    usable, w = _usable_views(points, weights, visible)
+    xy = np.where(usable[..., None], points, 0.0)
+    X = np.array(X0, dtype=np.float64)
+    active = ~np.isnan(X).any(axis=-1) & (usable.sum(axis=-1) >= 2)
+    X[~active] = 0.0
+
+    def cost_of(X):
+        proj, _ = _project(Ps, X)
+        r = proj - xy
+        return r, np.sum(w * np.sum(r ** 2, axis=-1), axis=-1)
+
+    r, cost = cost_of(X)
+    damping = np.full(cost.shape, 1e-3)
+    for _ in range(max_iter):
+        # d(u, v)/dX = (P[:2, :3] - (u, v) P[2, :3]) / depth, per point and view.
+        proj, depth = _project(Ps, X)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            J = (Ps[:, :2, :3] - proj[..., :, None] * Ps[:, 2, None, :3]) / depth[..., None, None]
+        # Stack the weighted rows of all views so the normal equations are plain matmuls.
+        sqrt_w = np.sqrt(w)[..., None]
+        n_rows = 2 * Ps.shape[0]
+        Jw = (J * sqrt_w[..., None]).reshape(J.shape[:-3] + (n_rows, 3))
+        rw = (r * sqrt_w).reshape(r.shape[:-2] + (n_rows, 1))
+        JtJ = np.matmul(Jw.swapaxes(-1, -2), Jw)
+        g = np.matmul(Jw.swapaxes(-1, -2), rw)[..., 0]
+        A = JtJ + damping[..., None, None] * (JtJ * np.eye(3))
+        A[~active] = np.eye(3)
+        step = -np.linalg.solve(A, g[..., None])[..., 0]
+        step[~active] = 0.0
+
+        new_r, new_cost = cost_of(X + step)
+        better = active & (new_cost < cost)
+        converged = active & better & (cost - new_cost <= tol * cost)
+        X[better] += step[better]
+        r[better] = new_r[better]
+        cost[better] = new_cost[better]
+        damping = np.where(better, damping / 10, damping * 10)
+        active &= ~converged & (damping < 1e9)
+        if not active.any():
+            break
+
+    errors = np.where(usable, np.linalg.norm(r, axis=-1), np.nan)
+    valid = ~np.isnan(np.asarray(X0, dtype=np.float64)).any(axis=-1) & (usable.sum(axis=-1) >= 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rms = np.sqrt(cost / w.sum(axis=-1))
+    X[~valid] = np.nan
+    errors[~valid] = np.nan
+    rms[~valid] = np.nan
+    return X, errors, rms
+
+# Fundamental matrix of a calibrated pair (x1^T F x0 = 0), for camera1 at X1 = R X0 + T.
+def fundamental_matrix(K0, K1, R, T):
+    t = np.ravel(T)
+    T_cross = np.array([[0, -t[2], t[1]], [t[2], 0, -t[0]], [-t[1], t[0], 0]])
+    F = np.linalg.inv(K1).T @ T_cross @ R @ np.linalg.inv(K0)
+    return F / F[2, 2] if abs(F[2, 2]) > 1e-12 else F
+
+# Symmetric epipolar distance of correspondences x0 <-> x1: the distances of x1 to the epipolar
+# line F x0 and of x0 to F^T x1, combined as sqrt(d0^2 + d1^2).
+#   x0, x1: (..., 2) pixel coordinates. Returns (...,) distances, NaN where a point is missing.
+def symmetric_epipolar_distance(F, x0, x1):
+    x0 = np.asarray(x0, dtype=np.float64)
+    x1 = np.asarray(x1, dtype=np.float64)
+    x0h = np.concatenate([x0, np.ones(x0.shape[:-1] + (1,))], axis=-1)
+    x1h = np.concatenate([x1, np.ones(x1.shape[:-1] + (1,))], axis=-1)
+    lines1 = x0h @ F.T  # epipolar lines in image 1
+    lines0 = x1h @ F    # epipolar lines in image 0
+    algebraic = np.sum(x1h * lines1, axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.abs(algebraic) * np.sqrt(1 / np.sum(lines1[..., :2] ** 2, axis=-1) +
+                                           1 / np.sum(lines0[..., :2] ** 2, axis=-1))
+
+# Gate correspondences between two views before triangulating them.
+#   x0, x1: (..., 2) pixel coordinates, c0, c1: optional (...,) confidences.
+# Returns a (...,) boolean mask of the pairs that are present in both views, within
+# max_distance pixels of their epipolar lines and at least min_confidence in both views.
+def epipolar_gate(F, x0, x1, c0=None, c1=None, max_distance=None, min_confidence=0.0):
+    distance = symmetric_epipolar_distance(F, x0, x1)
+    keep = ~np.isnan(distance)
+    if max_distance is not None:
+        keep &= distance <= max_distance
+    if min_confidence > 0:
+        for c in (c0, c1):
+            if c is not None:
+                keep &= np.nan_to_num(np.asarray(c, dtype=np.float64)) >= min_confidence
+    return keep
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+
+import cv2 as cv
+import numpy as np
+import yaml
+
+# Synthetic stand-ins for the phone recordings: checkerboard calibration videos rendered
+# through known camera parameters, and dog-skeleton landmark streams in the NDJSON format
+# written by pose-estimation-video (front_video.json / side_video.json).
+
+# A two-phone rig similar to the one in the README: camera1 is turned ~9 degrees towards
+# camera0 and sits 8 units to its right. Sized for the 360x480 frames in calibration_settings.yaml.
+DEFAULT_CMTX = np.array([[400.0, 0.0, 180.0],
+                         [0.0, 400.0, 240.0],
+                         [0.0, 0.0, 1.0]])
+DEFAULT_DIST = np.array([[-0.05, 0.02, 0.0, 0.0, 0.0]])
+DEFAULT_R1 = cv.Rodrigues(np.array([0.0, -0.15, 0.0]))[0]
+DEFAULT_T1 = np.array([[8.0], [0.0], [1.5]])
+
+# Dog skeleton in its body frame (x forward, y down, z to the dog's right), keyed by the
+# Vision landmark names. Units match checkerboard_box_size_scale.
+DOG_SKELETON = {
+    "animal_joint_nose": (32, -18, 0),
+    "animal_joint_left_eye": (28, -22, -3),
+    "animal_joint_right_eye": (28, -22, 3),
+    "animal_joint_left_ear_bottom": (24, -24, -4),
+    "animal_joint_right_ear_bottom": (24, -24, 4),
+    "animal_joint_left_ear_middle": (23, -28, -5),
+    "animal_joint_right_ear_middle": (23, -28, 5),
+    "animal_joint_left_ear_top": (22, -32, -6),
+    "animal_joint_right_ear_top": (22, -32, 6),
+    "animal_joint_heck": (20, -12, 0),
+    "animal_joint_tail_bottom": (-22, -8, 0),
+    "animal_joint_tail_middle": (-30, -14, 0),
+    "animal_joint_tail_top": (-36, -20, 0),
+    "animal_joint_right_front_elbow": (18, 2, 5),
+    "animal_joint_right_front_knee": (18, 12, 5),
+    "animal_joint_right_front_paw": (18, 22, 5),
+    "animal_joint_left_front_elbow": (18, 2, -5),
+    "animal_joint_left_front_knee": (18, 12, -5),
+    "animal_joint_left_front_paw": (18, 22, -5),
+    "animal_joint_right_back_elbow": (-18, 2, 5),
+    "animal_joint_right_back_knee": (-20, 12, 5),
+    "animal_joint_right_back_paw": (-18, 22, 5),
+    "animal_joint_left_back_elbow": (-18, 2, -5),
+    "animal_joint_left_back_knee": (-20, 12, -5),
+    "animal_joint_left_back_paw": (-18, 22, -5),
+}
+
+# Render the checkerboard texture. Returns the image and the 3x3 matrix mapping texture
+# pixels to board coordinates (the first inner corner is the board origin, as in calib.py).
+def checkerboard_texture(rows, columns, box_size, square_px=40):
+    margin = square_px
+    height, width = (columns + 1) * square_px + 2 * margin, (rows + 1) * square_px + 2 * margin
+    ys, xs = np.mgrid[0:height, 0:width]
+    squares = ((xs - margin) // square_px + (ys - margin) // square_px) % 2 == 0
+    inside = (xs >= margin) & (xs < width - margin) & (ys >= margin) & (ys < height - margin)
+    texture = np.where(inside & squares, 0, 255).astype(np.uint8)
+    scale = box_size / square_px
+    # cv.remap samples texture pixels at their centers, so square edges sit half a pixel early.
+    offset = -(margin + square_px - 0.5) * scale
+    texture_to_board = np.array([[scale, 0, offset], [0, scale, offset], [0, 0, 1]])
+    return texture, texture_to_board
+
+# Undistorted normalized ray (x, y, 1) of every pixel, computed once per camera.
+def _pixel_rays(cmtx, dist, img_shape):
+    width, height = img_shape
+    ys, xs = np.mgrid[0:height, 0:width].astype(np.float32)
+    pixels = np.stack([xs.ravel(), ys.ravel()], axis=-1).reshape(-1, 1, 2)
+    normalized = cv.undistortPointsIter(pixels, cmtx, dist, None, None,
+                                        (cv.TERM_CRITERIA_COUNT | cv.TERM_CRITERIA_EPS, 20, 1e-8))
+    return np.concatenate([normalized.reshape(-1, 2), np.ones((width * height, 1))], axis=1)
+
+# Random board poses (rotation vectors, translations) in the camera0 frame, around `center`.
+def random_board_poses(n_frames, center=(0.0, -4.0, 45.0), seed=0):
+    rng = np.random.default_rng(seed)
+    # Tilts beyond ~0.5 rad make the board too oblique for reliable corner ordering.
+    rvecs = np.column_stack([rng.uniform(-0.4, 0.4, n_frames), rng.uniform(-0.4, 0.4, n_frames),
+                             rng.uniform(-0.15, 0.15, n_frames)])
+    tvecs = np.column_stack([center[0] + rng.normal(0, 3, n_frames), center[1] + rng.normal(0, 2, n_frames),
+                             center[2] + rng.normal(0, 4, n_frames)])
+    return rvecs, tvecs
+
+# Render one synchronized checkerboard video per camera. Every pixel is traced through the
+# distortion model back to the board plane, so the videos match cmtxs/dists exactly.
+#   cmtxs, dists, Rs, Ts: camera parameters (camera0 at identity), board_rvecs/tvecs: board poses.
+# Returns the paths of the written videos.
+def render_checkerboard_videos(output_folder, cmtxs, dists, Rs, Ts, board_rvecs, board_tvecs,
+                               rows, columns, box_size, img_shape=(360, 480), noise=2.0, fps=30, seed=0):
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    rng = np.random.default_rng(seed)
+    texture, texture_to_board = checkerboard_texture(rows, columns, box_size)
+    board_to_texture = np.linalg.inv(texture_to_board)
+    width, height = img_shape
+
+    paths = []
+    for cam, (cmtx, dist, R, T) in enumerate(zip(cmtxs, dists, Rs, Ts)):
+        rays = _pixel_rays(cmtx, dist, img_shape)
+        path = os.path.join(output_folder, f"camera{cam}.avi")
+        writer = cv.VideoWriter(path, cv.VideoWriter_fourcc(*'MJPG'), fps, img_shape)
+        for rvec, tvec in zip(board_rvecs, board_tvecs):
+            R_board = R @ cv.Rodrigues(np.asarray(rvec, dtype=np.float64))[0]
+            t_board = R @ np.reshape(tvec, (3, 1)) + T
+            # Homography from board coordinates to normalized image coordinates.
+            H = np.column_stack([R_board[:, 0], R_board[:, 1], t_board[:, 0]])
+            uv = rays @ (board_to_texture @ np.linalg.inv(H)).T
+            maps = (uv[:, :2] / uv[:, 2:]).astype(np.float32).reshape(height, width, 2)
+            frame = cv.remap(texture, maps[..., 0], maps[..., 1], cv.INTER_LINEAR,
+                             borderMode=cv.BORDER_CONSTANT, borderValue=128)
+            frame = np.clip(frame + rng.normal(0, noise, frame.shape), 0, 255).astype(np.uint8)
+            writer.write(cv.cvtColor(frame, cv.COLOR_GRAY2BGR))
+        writer.release()
+        paths.append(path)
+    return paths
+
+# 3D positions of the dog skeleton walking across the scene, in the camera0 frame.
+# Returns a list of {landmark: (3,) position} dicts, one per frame.
+def dog_trajectory(n_frames, start=(-5.0, 5.0, 100.0), end=(5.0, 5.0, 100.0), fps=30, stride_hz=1.5):
+    start, end = np.asarray(start), np.asarray(end)
+    frames = []
+    for i in range(n_frames):
+        t = i / max(n_frames - 1, 1)
+        swing = 4.0 * np.sin(2 * np.pi * stride_hz * i / fps)
+        center = start + t * (end - start)
+        positions = {}
+        for name, (x, y, z) in DOG_SKELETON.items():
+            if "knee" in name or "paw" in name:
+                # Diagonal leg pairs swing together.
+                diagonal = ("right_front" in name) or ("left_back" in name)
+                x += (swing if diagonal else -swing) * (1.0 if "paw" in name else 0.5)
+            positions[name] = center + np.array([x, y, z], dtype=np.float64)
+        frames.append(positions)
+    return frames
+
+# Write one NDJSON landmark stream as seen by a camera, in the format of pose-estimation-video:
+# Vision normalized coordinates (origin bottom-left), confidences and string values.
+#   noise is the pixel noise, dropout the probability that a landmark is missing.
+# Returns the clean pixel observations (frames, landmarks, 2) in DOG_SKELETON order.
+def write_landmark_stream(filename, trajectory, cmtx, dist, R, T, img_shape=(360, 480),
+                          noise=1.0, dropout=0.05, seed=0):
+    rng = np.random.default_rng(seed)
+    width, height = img_shape
+    names = list(DOG_SKELETON)
+    rvec = cv.Rodrigues(np.asarray(R, dtype=np.float64))[0]
+    pixels = []
+    with open(filename, "w") as outf:
+        for frame_idx, positions in enumerate(trajectory):
+            points = np.array([positions[name] for name in names])
+            projected, _ = cv.projectPoints(points, rvec, np.asarray(T, dtype=np.float64), cmtx, dist)
+            projected = projected.reshape(-1, 2)
+            pixels.append(projected)
+            observed = projected + rng.normal(0, noise, projected.shape)
+            x_norm, y_norm = observed[:, 0] / width, 1 - observed[:, 1] / height
+            inside = (x_norm >= 0) & (x_norm < 1) & (y_norm >= 0) & (y_norm < 1)
+            landmarks = {}
+            for name, x, y, keep in zip(names, x_norm, y_norm, inside & (rng.random(len(names)) >= dropout)):
+                if keep:
+                    landmarks[name] = {"x": str(x), "y": str(y), "c": str(rng.uniform(0.5, 1.0))}
+            bounding_box = {}
+            if inside.any():
+                bounding_box = {"x0": str(x_norm[inside].min()), "y0": str(y_norm[inside].min()),
+                                "x1": str(x_norm[inside].max()), "y1": str(y_norm[inside].max())}
+            frame = {
+                "frame": frame_idx,
+                "absolute_time": str(frame_idx / 30.0),
+                "relative_time": "",
+                "bounding_box": bounding_box,
+                "landmarks": landmarks,
+            }
+            outf.write(json.dumps(frame) + "\n")
+    return np.array(pixels)
+
+# Camera parameters of camera0..n-1 from a calib.py output folder.
+def load_rig(folder, n_cameras=2):
+    from calib import load_camera_intrinsics, load_camera_extrinsics
+    cmtxs, dists, Rs, Ts = [], [], [], []
+    for cam in range(n_cameras):
+        cmtx, dist = load_camera_intrinsics(f'camera{cam}', folder)
+        R, T = load_camera_extrinsics(f'camera{cam}', folder)
+        cmtxs.append(cmtx)
+        dists.append(dist)
+        Rs.append(R)
+        Ts.append(T)
+    return cmtxs, dists, Rs, Ts
+
+# The default synthetic two-phone rig.
+def default_rig():
+    return ([DEFAULT_CMTX, DEFAULT_CMTX], [DEFAULT_DIST, DEFAULT_DIST],
+            [np.eye(3), DEFAULT_R1], [np.zeros((3, 1)), DEFAULT_T1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic calibration videos and landmark streams.")
+    parser.add_argument("output_folder", help="Where to write the videos and NDJSON files.")
+    parser.add_argument("--settings", default="calibration_settings.yaml", help="Calibration settings file.")
+    parser.add_argument("--camera-parameters", default=None,
+                        help="calib.py output folder to use instead of the default synthetic rig.")
+    parser.add_argument("--calibration-frames", type=int, default=300, help="Length of the checkerboard videos.")
+    parser.add_argument("--landmark-frames", type=int, default=900, help="Length of the landmark streams.")
+    parser.add_argument("--noise", type=float, default=1.0, help="Landmark pixel noise.")
+    parser.add_argument("--dropout", type=float, default=0.05, help="Probability that a landmark is missing.")
+    args = parser.parse_args()
+
+    with open(args.settings) as f:
+        settings = yaml.safe_load(f)
+    img_shape = (settings.get('frame_width', 360), settings.get('frame_height', 480))
+    rig = load_rig(args.camera_parameters) if args.camera_parameters else default_rig()
+
+    board_rvecs, board_tvecs = random_board_poses(args.calibration_frames)
+    paths = render_checkerboard_videos(args.output_folder, *rig, board_rvecs, board_tvecs,
+                                       settings['checkerboard_rows'], settings['checkerboard_columns'],
+                                       settings['checkerboard_box_size_scale'], img_shape)
+    print("Wrote", ", ".join(paths))
+
+    trajectory = dog_trajectory(args.landmark_frames)
+    cmtxs, dists, Rs, Ts = rig
+    for cam, view in enumerate(["front", "side"]):
+        filename = os.path.join(args.output_folder, f"{view}_video.json")
+        write_landmark_stream(filename, trajectory, cmtxs[cam], dists[cam], Rs[cam], Ts[cam], img_shape,
+                              noise=args.noise, dropout=args.dropout, seed=cam)
+        print("Wrote", filename)
+
+if __name__ == "__main__":
+    main()
@@ -3,19 +3,25 @@ import cv2
 import numpy as np
 import pandas as pd
 import argparse
+import os
 import sys
 import matplotlib
-matplotlib.use('TkAgg')
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D  # noqa: F401
 from matplotlib.widgets import Button, Slider
 
+from calib import load_camera_intrinsics, load_camera_extrinsics, load_fundamental_matrix, get_projection_matrix
+from calib import get_rectification, rectify_pair, rectified_projection_matrices, load_board_observations
+from multiview import triangulate_points, refine_points, epipolar_gate, fundamental_matrix
+
 # -----------------------------------------
 # Global Navigation State
 # -----------------------------------------
 current_frame = 0
 paused = True
 show_names = True
+# 3D landmarks of the whole session (frames, landmarks, 3), triangulated once in main().
+points_3d = None
 
 # -----------------------------------------
 # Hard-coded Camera Calibration
@@ -53,22 +59,82 @@ P1 = K1 @ np.hstack((R, T))
 # -----------------------------------------
 # Landmark Triangulation (DLT)
 # -----------------------------------------
-def triangulate_point(PA, PB, xA, yA, xB, yB):
-    """
-    DLT-based triangulation of one landmark from two cameras.
-    (xA, yA) are coordinates in camera0, (xB, yB) in camera1.
-    """
-    A = [
-        (yA * PA[2, :] - PA[1, :]),
-        (PA[0, :] - xA * PA[2, :]),
-        (yB * PB[2, :] - PB[1, :]),
-        (PB[0, :] - xB * PB[2, :])
-    ]
-    A = np.array(A)
-    _, _, Vt = np.linalg.svd(A)
-    X = Vt[-1, :]
-    X /= X[-1]
-    return X[:3]
+# Load the intrinsics and projection matrices of camera0..N-1 saved by calib.py.
+# Returns the camera matrices, distortion coefficients, (N, 3, 4) projection matrices and the
+# extrinsics of every camera.
+def load_calibration(folder, n_cameras):
+    cmtxs, dists, Ps, Rs, Ts = [], [], [], [], []
+    for cam in range(n_cameras):
+        cmtx, dist = load_camera_intrinsics(f'camera{cam}', folder)
+        R_cam, T_cam = load_camera_extrinsics(f'camera{cam}', folder)
+        cmtxs.append(cmtx)
+        dists.append(dist)
+        Ps.append(get_projection_matrix(cmtx, R_cam, T_cam))
+        Rs.append(R_cam)
+        Ts.append(T_cam)
+    return cmtxs, dists, np.stack(Ps), Rs, Ts
+
+# Collect the per-view pixel coordinates and confidences of a landmarks table
+# (columns <view>_<landmark>_x/_y/_c, as written by join_jsons.py).
+# Returns points (frames, landmarks, views, 2) and confidences (frames, landmarks, views);
+# missing columns or values are NaN points with zero confidence.
+def extract_views(df, landmarks, views):
+    n_frames = len(df)
+    points = np.full((n_frames, len(landmarks), len(views), 2), np.nan)
+    confidences = np.zeros((n_frames, len(landmarks), len(views)))
+    for j, lm in enumerate(landmarks):
+        for v, view in enumerate(views):
+            for k, axis in enumerate(("x", "y")):
+                col = f"{view}_{lm}_{axis}"
+                if col in df.columns:
+                    points[:, j, v, k] = pd.to_numeric(df[col], errors='coerce')
+            col = f"{view}_{lm}_c"
+            if col in df.columns:
+                confidences[:, j, v] = np.nan_to_num(pd.to_numeric(df[col], errors='coerce'))
+            else:
+                confidences[:, j, v] = 1.0
+    return points, confidences
+
+# Vision landmarks are normalized (0..1, origin at the bottom left) and still distorted.
+# Convert (..., views, 2) points to undistorted pixels of each view, the units of the projection
+# matrices and fundamental matrix. img_shape is the (width, height) the cameras were calibrated at.
+def landmarks_to_pixels(points, cmtxs, dists, img_shape):
+    width, height = img_shape
+    pixels = np.empty_like(points)
+    pixels[..., 0] = points[..., 0] * width
+    pixels[..., 1] = (1 - points[..., 1]) * height
+    for v, (cmtx, dist) in enumerate(zip(cmtxs, dists)):
+        view = pixels[..., v, :]
+        pixels[..., v, :] = cv2.undistortPoints(view.reshape(-1, 1, 2), cmtx, dist, P=cmtx).reshape(view.shape)
+    return pixels
+
+# Triangulate every landmark of every frame at once from any number of views.
+# The landmarks are first converted to undistorted pixels (see landmarks_to_pixels), so gating,
+# triangulation and refinement all work in the units of Ps and F. Views are weighted by their
+# confidence (_c) columns. Views below min_confidence are dropped and, for two views with a
+# fundamental matrix F, pairs farther than max_epipolar_distance from their epipolar lines are
+# rejected. Only landmarks that still have two views are triangulated, the others stay NaN.
+# With refine=True the DLT result is refined by minimizing the weighted reprojection error.
+# Returns the points (frames, landmarks, 3) and their RMS reprojection error in pixels
+# (frames, landmarks).
+def triangulate_session(df, landmarks, views, Ps, cmtxs, dists, img_shape, refine=False, F=None,
+                        max_epipolar_distance=None, min_confidence=0.0):
+    points, confidences = extract_views(df, landmarks, views)
+    points = landmarks_to_pixels(points, cmtxs, dists, img_shape)
+    visible = confidences >= min_confidence
+    if F is not None and len(views) == 2 and max_epipolar_distance is not None:
+        keep = epipolar_gate(F, points[..., 0, :], points[..., 1, :], confidences[..., 0], confidences[..., 1],
+                             max_distance=max_epipolar_distance, min_confidence=min_confidence)
+        visible &= keep[..., None]
+    solve = (visible & (confidences > 0) & ~np.isnan(points).any(axis=-1)).sum(axis=-1) >= 2
+
+    X = np.full(points.shape[:2] + (3,), np.nan)
+    rms = np.full(points.shape[:2], np.nan)
+    points, confidences, visible = points[solve], confidences[solve], visible[solve]
+    X_solved = triangulate_points(Ps, points, weights=confidences, visible=visible)
+    X[solve], _, rms[solve] = refine_points(Ps, points, X_solved, weights=confidences, visible=visible,
+                                            max_iter=10 if refine else 0)
+    return X, rms
 
 # -----------------------------------------
 # Dog-Skeleton Connection Functions
@@ -157,24 +223,53 @@ def draw_dog_2d(row, view, ax):
         if not missing:
             ax.plot(xs, ys, color=rule["color"], linewidth=2)
 
+# BGR equivalents of the skeleton colors used in the plots.
+OVERLAY_COLORS = {
+    "grey": (128, 128, 128), "cyan": (255, 255, 0), "black": (0, 0, 0), "pink": (203, 192, 255),
+    "blue": (255, 0, 0), "orange": (0, 165, 255), "green": (0, 128, 0), "purple": (128, 0, 128),
+}
+
+# Write a rectified side-by-side video of the front and side recordings with the triangulated
+# skeleton projected into both views. Frames are rectified with the cached maps of rect.
+def write_skeleton_overlay(video_path0, video_path1, rect, landmarks, output_path):
+    caps = [cv2.VideoCapture(video_path0), cv2.VideoCapture(video_path1)]
+    if not all(cap.isOpened() for cap in caps):
+        sys.exit("Error opening one of the overlay videos.")
+    Ps_rect = rectified_projection_matrices(rect)
+    width, height = (int(v) for v in rect['img_shape'])
+    # Play back at the recording's frame rate (phones often record at 60 fps), 30 if it is unknown.
+    fps = caps[0].get(cv2.CAP_PROP_FPS) or 30
+    writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (2 * width, height))
+    for frame_idx in range(len(points_3d)):
+        reads = [cap.read() for cap in caps]
+        if not all(ret for ret, _ in reads):
+            break
+        combined = rectify_pair(reads[0][1], reads[1][1], rect, line_spacing=0)
+        segments = draw_dog_3d(process_frame_3d(frame_idx, landmarks))
+        for cam, P in enumerate(Ps_rect):
+            # Draw on a copy of each view so lines do not cross into the other one.
+            view = np.ascontiguousarray(combined[:, cam * width:(cam + 1) * width])
+            for xs, ys, zs, color in segments:
+                x = np.column_stack([xs, ys, zs, np.ones(len(xs))]) @ P.T
+                if (x[:, 2] <= 0).any():
+                    continue
+                pixels = np.round(x[:, :2] / x[:, 2:]).astype(np.int32)
+                cv2.polylines(view, [pixels], False, OVERLAY_COLORS[color], 2)
+            combined[:, cam * width:(cam + 1) * width] = view
+        writer.write(combined)
+    writer.release()
+    for cap in caps:
+        cap.release()
+    print(f"Saved skeleton overlay to '{output_path}'.")
+
 # -----------------------------------------
 # Triangulate 3D Landmarks for a Frame
 # -----------------------------------------
-def process_frame_3d(row, landmarks):
+def process_frame_3d(frame_idx, landmarks):
     data_3d = {}
-    for lm in landmarks:
-        fx_col = f"front_{lm}_x"
-        fy_col = f"front_{lm}_y"
-        sx_col = f"side_{lm}_x"
-        sy_col = f"side_{lm}_y"
-        if fx_col in row.index and fy_col in row.index and sx_col in row.index and sy_col in row.index:
-            fx = row[fx_col]
-            fy = row[fy_col]
-            sx = row[sx_col]
-            sy = row[sy_col]
-            if not (pd.isna(fx) or pd.isna(fy) or pd.isna(sx) or pd.isna(sy)):
-                X = triangulate_point(P0, P1, fx, fy, sx, sy)
-                data_3d[lm] = X
+    for lm, X in zip(landmarks, points_3d[frame_idx]):
+        if not np.isnan(X).any():
+            data_3d[lm] = X
     return data_3d
 
 # -----------------------------------------
@@ -186,7 +281,7 @@ def update_all_plots(ax3d, ax_front, ax_side, row, landmarks, num_frame, num_fra
     ax3d.set_xlabel("X")
     ax3d.set_ylabel("Y")
     ax3d.set_zlabel("Z")
-    data_3d = process_frame_3d(row, landmarks)
+    data_3d = process_frame_3d(num_frame - 1, landmarks)
     if data_3d:
         for lm, pt in data_3d.items():
             ax3d.scatter(pt[0], pt[1], pt[2], c='b', marker='o')
@@ -277,12 +372,54 @@ def timer_event(df, landmarks, ax3d, ax_front, ax_side, num_frames, slider):
 # Main Interactive Code
 # -----------------------------------------
 def main():
-    global current_frame, paused
+    global current_frame, paused, points_3d
     parser = argparse.ArgumentParser(
         description="3D Dog Reconstruction with pre-calibrated cameras and dog skeleton."
     )
     parser.add_argument("csv_file", help="Path to the CSV file with landmark data.")
+    parser.add_argument("--views", nargs="+", default=["front", "side"],
+                        help="Column prefixes of the views, in camera order (default: front side).")
+    parser.add_argument("--camera-parameters", default=None,
+                        help="Folder with calib.py results to use instead of the hard-coded calibration.")
+    parser.add_argument("--image-size", nargs=2, type=int, default=None, metavar=("WIDTH", "HEIGHT"),
+                        help="Frame size the cameras were calibrated at (default: the size cached with "
+                             "--camera-parameters, else 360 480).")
+    parser.add_argument("--refine", action="store_true",
+                        help="Refine the triangulated landmarks by minimizing their reprojection error.")
+    parser.add_argument("--max-epipolar-distance", type=float, default=None,
+                        help="Reject front/side pairs farther than this from their epipolar lines.")
+    parser.add_argument("--min-confidence", type=float, default=0.0,
+                        help="Ignore landmark detections below this confidence.")
+    parser.add_argument("--max-reprojection-error", type=float, default=None,
+                        help="Hide landmarks whose RMS reprojection error exceeds this many pixels.")
+    parser.add_argument("--overlay", nargs=2, metavar=("FRONT_VIDEO", "SIDE_VIDEO"), default=None,
+                        help="Write a rectified side-by-side video of these recordings with the 3D skeleton "
+                             "(needs --camera-parameters).")
+    parser.add_argument("--overlay-output", default="skeleton_overlay.mp4",
+                        help="Output file of --overlay (default: skeleton_overlay.mp4).")
     args = parser.parse_args()
+    if args.overlay and not args.camera_parameters:
+        # The overlay is rectified with the maps of a calib.py folder, so the skeleton has to be
+        # triangulated with the same calibration.
+        sys.exit("--overlay needs --camera-parameters.")
+
+    img_shape = (360, 480)
+    if args.image_size:
+        img_shape = tuple(args.image_size)
+    elif args.camera_parameters and os.path.exists(os.path.join(args.camera_parameters, 'board_observations.npz')):
+        _, _, img_shape = load_board_observations(os.path.join(args.camera_parameters, 'board_observations.npz'))
+
+    if args.camera_parameters:
+        cmtxs, dists, Ps, Rs, Ts = load_calibration(args.camera_parameters, len(args.views))
+        if os.path.exists(os.path.join(args.camera_parameters, 'camera0_camera1_fundamental.dat')):
+            F = load_fundamental_matrix('camera0_camera1', args.camera_parameters)
+        else:
+            F = fundamental_matrix(cmtxs[0], cmtxs[1], Rs[1], Ts[1])
+    elif len(args.views) == 2:
+        cmtxs, dists, Ps = [K0, K1], [dist0, dist1], np.stack([P0, P1])
+        F = fundamental_matrix(K0, K1, R, T)
+    else:
+        sys.exit("More than two views need --camera-parameters.")
 
     try:
         df = pd.read_csv(args.csv_file)
@@ -305,10 +442,34 @@ def main():
         "right_back_elbow", "right_back_knee", "right_back_paw",
         "left_back_elbow", "left_back_knee", "left_back_paw"
     ]
+    points_3d, reprojection_rms = triangulate_session(
+        df, landmarks, args.views, Ps, cmtxs, dists, img_shape, refine=args.refine, F=F,
+        max_epipolar_distance=args.max_epipolar_distance, min_confidence=args.min_confidence)
+    triangulated = ~np.isnan(points_3d).any(axis=-1)
+    print(f"Triangulated {triangulated.sum()} of {triangulated.size} landmarks after gating.")
+    print(f"Mean RMS reprojection error: {np.nanmean(reprojection_rms):.4f} px")
+    if args.max_reprojection_error is not None:
+        rejected = reprojection_rms > args.max_reprojection_error
+        points_3d[rejected] = np.nan
+        print(f"Rejected {rejected.sum()} landmarks above {args.max_reprojection_error} px reprojection error.")
+
+    if args.overlay:
+        for video_path in args.overlay:
+            cap = cv2.VideoCapture(video_path)
+            video_shape = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+            cap.release()
+            if video_shape != tuple(img_shape):
+                # The intrinsics and rectification maps are only valid at the calibrated resolution.
+                sys.exit(f"Overlay video '{video_path}' is {video_shape[0]}x{video_shape[1]} but the cameras "
+                         f"were calibrated at {img_shape[0]}x{img_shape[1]}.")
+        rect = get_rectification(1, img_shape, args.camera_parameters)
+        write_skeleton_overlay(args.overlay[0], args.overlay[1], rect, landmarks, args.overlay_output)
 
     # We want 2D plots of 360x480 pixels and a larger 3D plot.
     # At 100 dpi, 360px = 3.6 in and 480px = 4.8 in.
     # We'll create a figure that is 1080x960 pixels (10.8x9.6 inches) in total.
+    # Only the interactive viewer needs Tk, so the session functions (and the overlay) work headless.
+    matplotlib.use('TkAgg')
     fig = plt.figure(figsize=(10.8, 9.6), dpi=100)
 
     # Define positions in normalized coordinates: